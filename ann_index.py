@@ -0,0 +1,195 @@
+"""Inverted-file (IVF) approximate nearest-neighbour index for face features.
+
+An exact predict compares a face against every stored sample, so its cost
+grows with the roster. The index clusters the samples with k-means into
+nlist partitions. A query is compared against the partition centroids
+first, and only the samples in the nprobe closest partitions are scored
+exactly. nprobe is the recall/speed knob: nprobe = nlist is an exact
+search.
+
+Clustering runs on a random projection of the features (regenerated from a
+stored seed), so high-dimensional LBPH histograms cluster as cheaply as
+128-d embeddings. The caller picks the feature space the projection is
+applied to. For LBPH that is the square root of the histograms, whose L2
+distance tracks the chi-square distance used for the exact re-rank.
+
+The index only stores the centroids and one partition number per sample,
+in the same row order as the model. Adding samples assigns them to the
+nearest existing centroid and removing samples drops their entries, so
+neither needs a re-cluster.
+"""
+import os
+
+import numpy as np
+
+DEFAULT_NPROBE = 8
+# Below this many samples an exact scan is about as fast as probing
+MIN_INDEXED_SAMPLES = 2048
+PROJECTION_DIM = 256
+KMEANS_ITERATIONS = 12
+# k-means is fitted on at most this many samples per partition
+KMEANS_SAMPLES_PER_LIST = 64
+ASSIGN_CHUNK = 4096
+FORMAT_VERSION = 1
+
+
+def index_path(model_path):
+    return model_path + ".ivf"
+
+
+def default_nlist(count):
+    return int(min(4096, max(1, round(np.sqrt(count)))))
+
+
+def projection(dim, out_dim, seed):
+    """Gaussian random projection dim -> out_dim, or None if dim is already small"""
+    if dim <= out_dim:
+        return None
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((dim, out_dim), dtype=np.float32) / np.float32(np.sqrt(out_dim)))
+
+
+def nearest(points, centroids, k=1):
+    """Indices of the k nearest centroids of each point, by L2 distance"""
+    norms = np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty((len(points), k), dtype=np.int32)
+    for start in range(0, len(points), ASSIGN_CHUNK):
+        block = points[start:start + ASSIGN_CHUNK]
+        # ||p||^2 is the same for every centroid, so it does not change the order
+        dist = norms[None, :] - 2.0 * block @ centroids.T
+        if k == 1:
+            out[start:start + len(block), 0] = dist.argmin(axis=1)
+        else:
+            part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            order = np.take_along_axis(dist, part, axis=1).argsort(axis=1)
+            out[start:start + len(block)] = np.take_along_axis(part, order, axis=1)
+    return out
+
+
+def kmeans_plus_plus(points, nlist, rng):
+    """k-means++ seeding: spread-out initial centroids give more even partitions"""
+    chosen = [int(rng.integers(len(points)))]
+    dist = ((points - points[chosen[0]]) ** 2).sum(axis=1)
+    for _ in range(nlist - 1):
+        total = dist.sum()
+        i = int(rng.choice(len(points), p=dist / total)) if total > 0 else int(rng.integers(len(points)))
+        chosen.append(i)
+        np.minimum(dist, ((points - points[i]) ** 2).sum(axis=1), out=dist)
+    return points[chosen].copy()
+
+
+def kmeans(points, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """Lloyd's k-means on a sample of the points; returns the centroids"""
+    rng = np.random.default_rng(seed)
+    if len(points) > nlist * KMEANS_SAMPLES_PER_LIST:
+        points = points[np.sort(rng.choice(len(points), nlist * KMEANS_SAMPLES_PER_LIST, replace=False))]
+    centroids = kmeans_plus_plus(points, nlist, rng)
+    for _ in range(iterations):
+        assign = nearest(points, centroids)[:, 0]
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty partitions with random points so none stay unused
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = points[rng.choice(len(points), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, centroids, assignments, seed=0, input_dim=None, built_count=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.seed = seed
+        self.input_dim = input_dim
+        self.built_count = len(self.assignments) if built_count is None else built_count
+        self._projection = projection(input_dim, self.centroids.shape[1], seed) if input_dim else None
+        self._order = None
+
+    @classmethod
+    def build(cls, features, nlist=None, seed=0, iterations=KMEANS_ITERATIONS, transform=None):
+        """Cluster features (rows, optionally mapped through transform first).
+
+        Rows are transformed and projected a chunk at a time, so a
+        memory-mapped model is never copied whole.
+        """
+        count, dim = features.shape
+        nlist = min(nlist or default_nlist(count), count)
+        proj = projection(dim, PROJECTION_DIM, seed)
+        points = np.empty((count, proj.shape[1] if proj is not None else dim), dtype=np.float32)
+        for start in range(0, count, ASSIGN_CHUNK):
+            block = np.asarray(features[start:start + ASSIGN_CHUNK], dtype=np.float32)
+            if transform is not None:
+                block = transform(block)
+            points[start:start + len(block)] = block @ proj if proj is not None else block
+        centroids = kmeans(points, nlist, iterations, seed)
+        return cls(centroids, nearest(points, centroids)[:, 0], seed,
+                   dim if proj is not None else None, count)
+
+    def __len__(self):
+        return len(self.assignments)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def project(self, features):
+        features = np.asarray(features, dtype=np.float32).reshape(-1, self.input_dim or self.centroids.shape[1])
+        return features @ self._projection if self._projection is not None else features
+
+    def _lists(self):
+        # Rows grouped by partition (each group in row order) and each group's start
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind="stable").astype(np.int32)
+            self._offsets = np.searchsorted(self.assignments[self._order], np.arange(self.nlist + 1))
+        return self._order, self._offsets
+
+    def probe(self, feature, nprobe=DEFAULT_NPROBE):
+        """Sorted row numbers of the samples in the nprobe partitions nearest to feature"""
+        nprobe = max(1, min(nprobe, self.nlist))
+        lists = nearest(self.project(feature), self.centroids, nprobe)[0]
+        order, offsets = self._lists()
+        rows = np.concatenate([order[offsets[i]:offsets[i + 1]] for i in lists])
+        rows.sort()
+        return rows
+
+    def added(self, features):
+        """Index for the same rows plus new ones appended at the end"""
+        assignments = nearest(self.project(features), self.centroids)[:, 0]
+        return IVFIndex(self.centroids, np.concatenate([self.assignments, assignments]),
+                        self.seed, self.input_dim, self.built_count)
+
+    def removed(self, keep):
+        """Index without the rows where the boolean mask keep is False"""
+        return IVFIndex(self.centroids, self.assignments[keep], self.seed, self.input_dim, self.built_count)
+
+    def list_sizes(self):
+        return np.bincount(self.assignments, minlength=self.nlist)
+
+
+def save_index(index, path, model_id=""):
+    """Write the index for the model file whose header carries model_id"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, version=FORMAT_VERSION, centroids=index.centroids, assignments=index.assignments,
+                 seed=index.seed, input_dim=index.input_dim or 0, built_count=index.built_count,
+                 model_id=model_id or "")
+    os.replace(tmp_path, path)
+
+
+def load_index(path, model_id=""):
+    """IVFIndex saved by save_index() for model_id, or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if int(data["version"]) != FORMAT_VERSION:
+            return None
+        # The model and its index are replaced one after the other; an index
+        # written for another model (same size or not) must not be used
+        saved_id = str(data["model_id"]) if "model_id" in data.files else ""
+        if saved_id != (model_id or ""):
+            return None
+        return IVFIndex(data["centroids"], data["assignments"], int(data["seed"]),
+                        int(data["input_dim"]) or None, int(data["built_count"]))
@@ -1,22 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify, session
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response, g
 import os
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-import subprocess
 import csv
 from io import StringIO
-import glob
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
+import sqlite3
 import string
+import threading
+import time
+import zlib
+from training_jobs import TrainingJobRunner
+from db import ConnectionPool
+from search import search_students, search_attendance
+from cache import ResponseCache, LRUCache, data_version
+import migrations
+import dataset_manifest
+from attendance_writer import PeriodCache
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "dataset")
 TRAINER_PATH = os.path.join(BASE_DIR, "trainer", "trainer.yml")
-DB_PATH = os.path.join(BASE_DIR, "attendance.db")
+BINARY_TRAINER_PATH = os.path.join(BASE_DIR, "trainer", "trainer.lbph")
+# ATTENDANCE_DB points the app at another database (the benchmarks use it)
+DB_PATH = os.environ.get("ATTENDANCE_DB") or os.path.join(BASE_DIR, "attendance.db")
 ALLOWED_EXT = {"png", "jpg", "jpeg"}
+MAX_RECOGNIZE_BATCH = 32
 
 app = Flask(__name__)
 app.secret_key = "smart-attendance-secret-key-2025"
@@ -24,72 +35,83 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(os.path.join(BASE_DIR, "trainer"), exist_ok=True)
 
+db_pool = ConnectionPool(DB_PATH)
+db_pool.init_app(app)
+
 def get_db_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Pooled connection; within a request every call returns the same one"""
+    return db_pool.connection()
 
 def init_db():
-    """Initialize database with user tables"""
+    """Create or upgrade the database schema (see migrations.py); returns the attendance period"""
     conn = get_db_conn()
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        full_name TEXT NOT NULL,
-        role TEXT NOT NULL,
-        phone TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # OTP Verification table (for multi-step registration)
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS otp_verification (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        phone_or_email TEXT UNIQUE NOT NULL,
-        otp TEXT NOT NULL,
-        method TEXT NOT NULL,
-        verification_data TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        expires_at TIMESTAMP
-    )
-    ''')
-    
-    # Students table (updated)
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS students (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        name TEXT NOT NULL,
-        encoding BLOB,
-        phone TEXT,
-        email TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    ''')
-    
-    # Attendance table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS attendance (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER,
-        name TEXT,
-        timestamp TEXT,
-        status TEXT DEFAULT 'present',
-        FOREIGN KEY(student_id) REFERENCES students(id)
-    )
-    ''')
-    
-    conn.commit()
+    migrations.migrate(conn)
+    period_seconds = migrations.get_period_seconds(conn)
     conn.close()
+    return period_seconds
+
+# Shared with every recognizer through the settings table
+ATTENDANCE_PERIOD_SECONDS = init_db()
+training_jobs = TrainingJobRunner(DB_PATH, BASE_DIR)
+
+def attendance_total(conn, student_id=None, since_day=None):
+    """Attendance count read from the attendance_daily rollup, not the raw rows"""
+    where, params = [], []
+    if student_id is not None:
+        where.append("student_id = ?")
+        params.append(student_id)
+    if since_day is not None:
+        where.append("day >= ?")
+        params.append(since_day)
+    sql = "SELECT COALESCE(SUM(count), 0) FROM attendance_daily"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return conn.execute(sql, params).fetchone()[0]
+
+# Dashboard numbers only change when attendance/students do; see cache.py
+response_cache = ResponseCache()
+
+def cached_json(conn, key, build):
+    """JSON response for key from the cache, answering If-None-Match with 304"""
+    entry = response_cache.fetch(key, data_version(conn), build)
+    response = jsonify(entry.payload)
+    response.set_etag(entry.etag)
+    # Browsers must revalidate, which is cheap: a 304 carries no body
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+def recent_since_day():
+    """First day of the 'recent' window: the last 7 calendar days, today included"""
+    return (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")
 
-init_db()
+# Logged-in users, minus the password hash. Routes that change a user drop
+# its entry; the TTL bounds staleness from edits made by other workers.
+USER_CACHE_SIZE = 512
+USER_CACHE_TTL = 60.0
+user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def current_user():
+    """The session's user row as a dict, loaded at most once per request"""
+    if 'user_id' not in session:
+        return None
+    if "user" not in g:
+        user_id = session['user_id']
+        user = user_cache.get(user_id)
+        if user is None:
+            conn = get_db_conn()
+            row = conn.execute(
+                "SELECT id, email, full_name, role, phone, created_at FROM users WHERE id=?", (user_id,)
+            ).fetchone()
+            conn.close()
+            user = dict(row) if row else None
+            if user:
+                user_cache.put(user_id, user)
+        g.user = user
+    return g.user
+
+def invalidate_user(user_id):
+    user_cache.pop(user_id)
+    g.pop("user", None)
 
 def login_required(f):
     @wraps(f)
@@ -107,10 +129,7 @@ def teacher_required(f):
             flash("Please log in first.", "error")
             return redirect(url_for('login'))
         
-        conn = get_db_conn()
-        user = conn.execute("SELECT role FROM users WHERE id=?", (session['user_id'],)).fetchone()
-        conn.close()
-        
+        user = current_user()
         if not user or user['role'] != 'teacher':
             flash("Access denied. Teacher privileges required.", "error")
             return redirect(url_for('dashboard'))
@@ -144,6 +163,7 @@ def login():
         conn.close()
         
         if user and check_password_hash(user['password'], password):
+            invalidate_user(user['id'])
             session['user_id'] = user['id']
             session['email'] = user['email']
             session['role'] = user['role']
@@ -329,17 +349,18 @@ def register_details():
             hashed_password = generate_password_hash(password)
             
             if method == "phone":
-                conn.execute(
+                cur = conn.execute(
                     "INSERT INTO users (email, password, full_name, role, phone) VALUES (?, ?, ?, ?, ?)",
                     (f"user_{contact}@smartattendance.local", hashed_password, full_name, role, contact)
                 )
             else:  # google
-                conn.execute(
+                cur = conn.execute(
                     "INSERT INTO users (email, password, full_name, role, phone) VALUES (?, ?, ?, ?, ?)",
                     (contact, hashed_password, full_name, role, "")
                 )
             
             conn.commit()
+            invalidate_user(cur.lastrowid)
             
             # Clean up OTP verification
             conn.execute("DELETE FROM otp_verification WHERE phone_or_email=?", (contact,))
@@ -370,24 +391,27 @@ def logout():
 @app.route("/dashboard")
 @login_required
 def dashboard():
+    user = current_user()
     conn = get_db_conn()
-    user = conn.execute("SELECT * FROM users WHERE id=?", (session['user_id'],)).fetchone()
     
     if user['role'] == 'teacher':
-        students_count = conn.execute("SELECT COUNT(*) FROM students").fetchone()[0]
-        attendance_count = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+        counts = response_cache.fetch("dashboard", data_version(conn), lambda: {
+            "students_count": conn.execute("SELECT COUNT(*) FROM students").fetchone()[0],
+            "attendance_count": attendance_total(conn),
+        }).payload
+        students_count, attendance_count = counts["students_count"], counts["attendance_count"]
         conn.close()
         return render_template("teacher_dashboard.html", 
                              user=user,
                              students_count=students_count, 
                              attendance_count=attendance_count,
-                             trainer_exists=os.path.exists(TRAINER_PATH))
+                             trainer_exists=os.path.exists(BINARY_TRAINER_PATH) or os.path.exists(TRAINER_PATH))
     else:
         student = conn.execute("SELECT * FROM students WHERE user_id=?", (session['user_id'],)).fetchone()
         if student:
-            attendance_count = conn.execute("SELECT COUNT(*) FROM attendance WHERE student_id=?", (student['id'],)).fetchone()[0]
+            attendance_count = attendance_total(conn, student['id'])
             recent_attendance = conn.execute(
-                "SELECT timestamp FROM attendance WHERE student_id=? ORDER BY timestamp DESC LIMIT 5",
+                "SELECT timestamp FROM attendance WHERE student_id=? ORDER BY ts DESC LIMIT 5",
                 (student['id'],)
             ).fetchall()
         else:
@@ -405,8 +429,8 @@ def dashboard():
 @app.route("/profile")
 @login_required
 def profile():
+    user = current_user()
     conn = get_db_conn()
-    user = conn.execute("SELECT * FROM users WHERE id=?", (session['user_id'],)).fetchone()
     student = None
     if user['role'] == 'student':
         student = conn.execute("SELECT * FROM students WHERE user_id=?", (session['user_id'],)).fetchone()
@@ -432,16 +456,13 @@ def edit_profile():
         )
         conn.commit()
         conn.close()
+        invalidate_user(session['user_id'])
         
         session['full_name'] = full_name
         flash("Profile updated successfully!", "success")
         return redirect(url_for('profile'))
     
-    conn = get_db_conn()
-    user = conn.execute("SELECT * FROM users WHERE id=?", (session['user_id'],)).fetchone()
-    conn.close()
-    
-    return render_template("edit_profile.html", user=user)
+    return render_template("edit_profile.html", user=current_user())
 
 @app.route("/change-password", methods=["GET", "POST"])
 @login_required
@@ -475,6 +496,7 @@ def change_password():
         conn.execute("UPDATE users SET password=? WHERE id=?", (hashed_password, session['user_id']))
         conn.commit()
         conn.close()
+        invalidate_user(session['user_id'])
         
         flash("Password changed successfully!", "success")
         return redirect(url_for('profile'))
@@ -482,31 +504,107 @@ def change_password():
     return render_template("change_password.html")
 
 # ===== Teacher Routes =====
+# ===== Paged listings =====
+# Keyset pagination: each page seeks past the last row of the previous one
+# through an index, so deep pages cost the same as the first.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def page_limit():
+    try:
+        limit = int(request.args.get("limit", PAGE_SIZE))
+    except ValueError:
+        limit = PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def students_page(conn, search="", after=None, limit=PAGE_SIZE):
+    """Students ordered by id; returns (rows, next cursor or None).
+
+    A search returns the top `limit` matches by rank instead, with no cursor.
+    """
+    if search:
+        return search_students(conn, search, limit), None
+    after_id = int(after) if after and after.isdigit() else 0
+    rows = conn.execute("SELECT id, name, email, phone FROM students WHERE id > ? ORDER BY id LIMIT ?",
+                        (after_id, limit + 1)).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], str(rows[limit - 1]["id"])
+    return rows, None
+
+def parse_attendance_cursor(after):
+    """'<ts>:<id>' -> (ts, id); ts is None for rows without a timestamp"""
+    ts, _, last_id = (after or "").partition(":")
+    try:
+        return (int(ts) if ts else None), int(last_id)
+    except ValueError:
+        return None
+
+def attendance_page(conn, search="", after=None, limit=PAGE_SIZE):
+    """Attendance newest first, keyed on (ts, id); returns (rows, next cursor or None)"""
+    if search:
+        return search_attendance(conn, search, limit), None
+    cursor = parse_attendance_cursor(after)
+
+    def fetch(where, params, n):
+        sql = "SELECT id, student_id, name, timestamp, ts FROM attendance"
+        if where:
+            sql += " WHERE " + where
+        return conn.execute(sql + " ORDER BY ts DESC, id DESC LIMIT ?", params + [n]).fetchall()
+
+    if cursor is None:
+        rows = fetch(None, [], limit + 1)
+    elif cursor[0] is None:
+        rows = fetch("ts IS NULL AND id < ?", [cursor[1]], limit + 1)
+    else:
+        rows = fetch("(ts, id) < (?, ?)", list(cursor), limit + 1)
+        # Rows without a timestamp sort last; reach them once the rest run out
+        if len(rows) <= limit:
+            rows += fetch("ts IS NULL", [], limit + 1 - len(rows))
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        ts = "" if last["ts"] is None else last["ts"]
+        return rows[:limit], f"{ts}:{last['id']}"
+    return rows, None
+
 @app.route("/students")
 @teacher_required
 def students():
     search = request.args.get("search", "").strip()
+    after = request.args.get("after")
     conn = get_db_conn()
-    if search:
-        query = "SELECT id, name, email, phone FROM students WHERE LOWER(name) LIKE ? OR LOWER(email) LIKE ? ORDER BY id"
-        rows = conn.execute(query, (f"%{search.lower()}%", f"%{search.lower()}%")).fetchall()
-    else:
-        rows = conn.execute("SELECT id, name, email, phone FROM students ORDER BY id").fetchall()
+    rows, next_cursor = students_page(conn, search, after, page_limit())
     conn.close()
-    return render_template("students.html", students=rows, search=search)
+    return render_template("students.html", students=rows, search=search,
+                           after=after, next_cursor=next_cursor)
+
+@app.route("/api/students")
+@teacher_required
+def api_students():
+    conn = get_db_conn()
+    rows, next_cursor = students_page(conn, request.args.get("search", "").strip(),
+                                      request.args.get("after"), page_limit())
+    conn.close()
+    return jsonify({"students": [dict(r) for r in rows], "next_cursor": next_cursor})
 
 @app.route("/attendance")
 @teacher_required
 def attendance():
     search = request.args.get("search", "").strip()
+    after = request.args.get("after")
     conn = get_db_conn()
-    if search:
-        query = "SELECT id, student_id, name, timestamp FROM attendance WHERE LOWER(name) LIKE ? OR CAST(student_id AS TEXT) LIKE ? ORDER BY timestamp DESC"
-        rows = conn.execute(query, (f"%{search.lower()}%", f"%{search}%")).fetchall()
-    else:
-        rows = conn.execute("SELECT id, student_id, name, timestamp FROM attendance ORDER BY timestamp DESC").fetchall()
+    rows, next_cursor = attendance_page(conn, search, after, page_limit())
     conn.close()
-    return render_template("attendance.html", attendance=rows, search=search)
+    return render_template("attendance.html", attendance=rows, search=search,
+                           after=after, next_cursor=next_cursor)
+
+@app.route("/api/attendance")
+@teacher_required
+def api_attendance():
+    conn = get_db_conn()
+    rows, next_cursor = attendance_page(conn, request.args.get("search", "").strip(),
+                                        request.args.get("after"), page_limit())
+    conn.close()
+    return jsonify({"attendance": [dict(r) for r in rows], "next_cursor": next_cursor})
 
 @app.route("/student/<int:student_id>")
 @teacher_required
@@ -518,13 +616,10 @@ def student_detail(student_id):
         return redirect(url_for('students'))
     
     attendance_records = conn.execute(
-        "SELECT timestamp FROM attendance WHERE student_id=? ORDER BY timestamp DESC LIMIT 10",
+        "SELECT timestamp FROM attendance WHERE student_id=? ORDER BY ts DESC LIMIT 10",
         (student_id,)
     ).fetchall()
-    total_attendance = conn.execute(
-        "SELECT COUNT(*) FROM attendance WHERE student_id=?",
-        (student_id,)
-    ).fetchone()[0]
+    total_attendance = attendance_total(conn, student_id)
     conn.close()
     
     return render_template("student_detail.html", student=student, attendance=attendance_records, total=total_attendance)
@@ -542,84 +637,271 @@ def delete_student(student_id):
     
     cur.execute("DELETE FROM attendance WHERE student_id=?", (student_id,))
     cur.execute("DELETE FROM students WHERE id=?", (student_id,))
+    dataset_manifest.ensure_manifest(conn, UPLOAD_FOLDER)
+    images = dataset_manifest.remove_student(conn, student_id)
     conn.commit()
     conn.close()
     
-    for file in glob.glob(os.path.join(UPLOAD_FOLDER, f"*.{student_id}.*")):
+    for file in images:
         try:
-            os.remove(file)
+            os.remove(os.path.join(UPLOAD_FOLDER, file))
         except:
             pass
     
-    flash(f"Student {student['name']} deleted successfully.", "success")
+    flash(f"Student {student['name']} deleted successfully. The next incremental training run removes them from the model.", "success")
     return redirect(url_for('students'))
 
+EXPORT_CHUNK = 1000
+
+def export_filters(args):
+    """?from=&to= (YYYY-MM-DD, inclusive), ?student_id=, ?status= -> SQL WHERE + params"""
+    where, params = [], []
+    if args.get("from"):
+        where.append("ts >= ?")
+        params.append(migrations.epoch(args["from"] + " 00:00:00"))
+    if args.get("to"):
+        where.append("ts < ?")
+        # Next calendar day's midnight: a DST changeover day is 23 or 25 hours long
+        next_day = datetime.strptime(args["to"], "%Y-%m-%d") + timedelta(days=1)
+        params.append(migrations.epoch(next_day.strftime("%Y-%m-%d 00:00:00")))
+    if args.get("student_id"):
+        where.append("student_id = ?")
+        params.append(int(args["student_id"]))
+    if args.get("status"):
+        where.append("status = ?")
+        params.append(args["status"])
+    return where, params
+
+def generate_csv(where, params, compress=False):
+    """Yield the export in chunks straight from the cursor.
+
+    Uses its own pooled connection: the request's connection is released on
+    teardown, before the response body has finished streaming.
+    """
+    conn = db_pool.acquire()
+    gzipper = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    try:
+        sql = "SELECT student_id, name, timestamp FROM attendance"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        cur = conn.execute(sql + " ORDER BY ts, id", params)
+        buf = StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["student_id", "name", "timestamp"])
+        while True:
+            rows = cur.fetchmany(EXPORT_CHUNK)
+            if rows:
+                writer.writerows(rows)
+            data = buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+            if gzipper:
+                data = gzipper.compress(data) + (b"" if rows else gzipper.flush())
+            if data:
+                yield data
+            if not rows:
+                break
+        cur.close()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        db_pool.release(conn)
+
 @app.route("/export_csv")
 @teacher_required
 def export_csv():
-    conn = get_db_conn()
-    rows = conn.execute("SELECT student_id, name, timestamp FROM attendance ORDER BY timestamp").fetchall()
-    conn.close()
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(["student_id", "name", "timestamp"])
-    for r in rows:
-        writer.writerow([r["student_id"], r["name"], r["timestamp"]])
-    mem = StringIO(si.getvalue())
-    mem.seek(0)
-    return send_file(
-        path_or_file=mem,
-        mimetype="text/csv",
-        as_attachment=True,
-        download_name="attendance_export.csv"
+    try:
+        where, params = export_filters(request.args)
+    except ValueError:
+        flash("Invalid export filter: dates must be YYYY-MM-DD and the student ID a number.", "error")
+        return redirect(url_for('attendance'))
+    compress = request.args.get("gzip") in ("1", "on", "true")
+    download_name = "attendance_export.csv" + (".gz" if compress else "")
+    return Response(
+        generate_csv(where, params, compress),
+        mimetype="application/gzip" if compress else "text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{download_name}"'}
     )
 
 @app.route("/train", methods=["POST"])
 @teacher_required
 def train_trigger():
+    """Queue a background training job (or join the one already running)"""
     try:
-        proc = subprocess.run(["python", "train.py"], capture_output=True, text=True, timeout=300)
-        out = proc.stdout + "\n---\n" + proc.stderr
-        flash("Training finished successfully.", "success")
-        return render_template("train_result.html", output=out)
+        job_id, started = training_jobs.submit(requested_by=session['user_id'])
     except Exception as e:
         flash(f"Training failed: {e}", "error")
         return redirect(url_for('dashboard'))
+    
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job": training_jobs.get(job_id), "started": started}), 202
+    
+    if started:
+        flash("Training started in the background.", "success")
+    else:
+        flash("Training is already running; your request was added to that job.", "info")
+    return redirect(url_for('train_status_page', job_id=job_id))
+
+@app.route("/train/<int:job_id>")
+@teacher_required
+def train_status_page(job_id):
+    job = training_jobs.get(job_id)
+    if not job:
+        flash("Training job not found.", "error")
+        return redirect(url_for('dashboard'))
+    return render_template("train_result.html", job=job, output=job["output"] or "")
+
+@app.route("/api/train/latest")
+@teacher_required
+def train_status_latest():
+    return jsonify({"job": training_jobs.latest()})
+
+@app.route("/api/train/<int:job_id>")
+@teacher_required
+def train_status(job_id):
+    job = training_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"job": job})
 
 @app.route("/api/statistics")
 @login_required
 def get_statistics():
+    user = current_user()
     conn = get_db_conn()
-    user = conn.execute("SELECT role FROM users WHERE id=?", (session['user_id'],)).fetchone()
-    
-    if user['role'] == 'teacher':
-        total_students = conn.execute("SELECT COUNT(*) FROM students").fetchone()[0]
-        total_attendance = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
-        recent_attendance = conn.execute(
-            "SELECT COUNT(*) FROM attendance WHERE datetime(timestamp) >= datetime('now', '-7 days')"
-        ).fetchone()[0]
-    else:
-        total_students = 1
-        total_attendance = 0
-        recent_attendance = 0
+    since_day = recent_since_day()
+
+    def build():
+        if user['role'] == 'teacher':
+            return {
+                "total_students": conn.execute("SELECT COUNT(*) FROM students").fetchone()[0],
+                "total_attendance": attendance_total(conn),
+                "recent_attendance": attendance_total(conn, since_day=since_day)
+            }
+        stats = {"total_students": 1, "total_attendance": 0, "recent_attendance": 0}
         student = conn.execute("SELECT id FROM students WHERE user_id=?", (session['user_id'],)).fetchone()
         if student:
-            total_attendance = conn.execute(
-                "SELECT COUNT(*) FROM attendance WHERE student_id=?",
-                (student['id'],)
-            ).fetchone()[0]
-            recent_attendance = conn.execute(
-                "SELECT COUNT(*) FROM attendance WHERE student_id=? AND datetime(timestamp) >= datetime('now', '-7 days')",
-                (student['id'],)
-            ).fetchone()[0]
-    
+            stats["total_attendance"] = attendance_total(conn, student['id'])
+            stats["recent_attendance"] = attendance_total(conn, student['id'], since_day)
+        return stats
+
+    # The recent window moves at midnight, so the day is part of the key
+    key = ("statistics", "teacher" if user['role'] == 'teacher' else session['user_id'], since_day)
+    response = cached_json(conn, key, build)
     conn.close()
+    return response
+
+@app.route("/api/cache/stats")
+@teacher_required
+def cache_stats():
+    return jsonify({"responses": response_cache.stats(), "users": user_cache.stats()})
+
+# ===== Recognition API =====
+# One engine per request thread: the cascade classifier is not thread-safe,
+# and the memory-mapped model costs each thread milliseconds and no copy
+_recognition_local = threading.local()
+marked_periods = PeriodCache(ATTENDANCE_PERIOD_SECONDS)
+
+def get_recognition_engine():
+    """Model + cascade loaded once per thread, reloaded when training rewrites the model"""
+    model_path = BINARY_TRAINER_PATH if os.path.exists(BINARY_TRAINER_PATH) else TRAINER_PATH
+    if not os.path.exists(model_path):
+        return None
+    mtime = os.path.getmtime(model_path)
+    engine = getattr(_recognition_local, "engine", None)
+    if engine is None or engine["model_mtime"] != mtime:
+        import recognize_cv
+        import model_store
+        recognizer = model_store.load_recognizer(BINARY_TRAINER_PATH, TRAINER_PATH)
+        processor = recognize_cv.FrameProcessor(
+            recognizer, recognize_cv.create_face_cascade(), recognize_cv.load_id_name_map(DB_PATH, UPLOAD_FOLDER))
+        engine = _recognition_local.engine = {"processor": processor, "model_mtime": mtime}
+    return engine["processor"]
+
+def decode_frames():
+    """Gray frames from multipart JPEG/PNG uploads or a raw 8-bit gray body"""
+    import cv2
+    import numpy as np
+    
+    files = request.files.getlist("frames") or request.files.getlist("frame")
+    if files:
+        frames = []
+        for f in files:
+            data = np.frombuffer(f.read(), dtype=np.uint8)
+            frames.append(cv2.imdecode(data, cv2.IMREAD_GRAYSCALE) if data.size else None)
+        return frames
+    
+    width = request.args.get("width", type=int)
+    height = request.args.get("height", type=int)
+    if not width or not height:
+        raise ValueError("Send JPEG/PNG files as 'frames', or raw gray bytes with width and height.")
+    data = np.frombuffer(request.get_data(), dtype=np.uint8)
+    if data.size == 0 or data.size % (width * height):
+        raise ValueError("Raw body size is not a multiple of width*height.")
+    return list(data.reshape(-1, height, width))
+
+@app.route("/api/recognize", methods=["POST"])
+@teacher_required
+def api_recognize():
+    """Detect and recognize faces in one frame or a batch of frames"""
+    started = time.perf_counter()
+    try:
+        frames = decode_frames()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if len(frames) > MAX_RECOGNIZE_BATCH:
+        return jsonify({"error": f"At most {MAX_RECOGNIZE_BATCH} frames per request."}), 413
+    
+    results = []
+    # No lock: every request thread recognizes with its own engine
+    processor = get_recognition_engine()
+    if processor is None:
+        return jsonify({"error": "Model not found. Train the model first."}), 503
+    for index, gray in enumerate(frames):
+        if gray is None:
+            results.append({"index": index, "error": "could not decode frame", "faces": []})
+            continue
+        results.append({"index": index, "faces": processor.describe(gray)})
+    
+    marked = []
+    if request.args.get("mark") in ("1", "true", "yes"):
+        seen = {}
+        for frame in results:
+            for face in frame["faces"]:
+                if face["student_id"] is not None:
+                    seen[face["student_id"]] = face["name"]
+        now = datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        ts = int(now.timestamp())
+        # Students this worker already marked for the period need no write;
+        # the (student_id, period) upsert covers other workers and recognizers
+        rows = []
+        for sid, name in seen.items():
+            period = marked_periods.claim(sid, ts)
+            if period is not None:
+                rows.append((sid, name, timestamp, ts, period, ts))
+        if rows:
+            conn = get_db_conn()
+            try:
+                conn.executemany(migrations.UPSERT_ATTENDANCE, rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                # Give the claims back so the next sighting retries the write
+                for r in rows:
+                    marked_periods.release(r[0], r[4])
+                return jsonify({"frames": results, "marked": [],
+                                "error": f"Attendance not recorded: {e}"}), 503
+            finally:
+                conn.close()
+            marked = [{"student_id": r[0], "name": r[1], "timestamp": timestamp} for r in rows]
     
     return jsonify({
-        "total_students": total_students,
-        "total_attendance": total_attendance,
-        "recent_attendance": recent_attendance
-    })# ===== Old Routes (kept for compatibility) =====
+        "frames": results,
+        "marked": marked,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    })
+
+# ===== Old Routes (kept for compatibility) =====
 @app.route("/register_old", methods=["GET", "POST"])
 def register_old():
     """Old student image registration (deprecated, use /register for user account)"""
@@ -635,22 +917,22 @@ def register_old():
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             ext = filename.rsplit(".", 1)[1].lower()
-            existing = [f for f in os.listdir(UPLOAD_FOLDER) if f.startswith(f"{name}.{sid}.")]
-            next_index = len(existing) + 1
-            saved_name = f"{name}.{sid}.{next_index}.{ext}"
-            saved_path = os.path.join(UPLOAD_FOLDER, saved_name)
-            file.save(saved_path)
+            conn = get_db_conn()
+            dataset_manifest.ensure_manifest(conn, UPLOAD_FOLDER)
+            index = dataset_manifest.next_free_index(conn, sid, name, ext, UPLOAD_FOLDER)
+            saved_name = f"{name}.{sid}.{index}.{ext}"
+            file.save(os.path.join(UPLOAD_FOLDER, saved_name))
+            dataset_manifest.record_image(conn, saved_name, UPLOAD_FOLDER)
+            conn.commit()
         else:
             flash("Please upload a JPG/PNG image of the face.", "error")
             return redirect(request.url)
 
-        conn = get_db_conn()
         cur = conn.cursor()
         cur.execute("SELECT id FROM students WHERE id=?", (sid,))
         if cur.fetchone() is None:
-            import pickle
-            placeholder = pickle.dumps(b"")
-            cur.execute("INSERT INTO students (id, name, encoding) VALUES (?, ?, ?)", (sid, name, placeholder))
+            # Empty until train.py --backend embedding stores the face encodings
+            cur.execute("INSERT INTO students (id, name, encoding) VALUES (?, ?, ?)", (sid, name, b""))
             conn.commit()
             flash(f"Inserted student {name} ({sid}) into DB.", "success")
         else:
@@ -0,0 +1,240 @@
+"""Batched, asynchronous attendance writes for recognition clients.
+
+A single background thread owns one long-lived SQLite connection. Recognized
+students are queued with mark() (which never touches the DB on the caller's
+thread) and written with one executemany() per transaction, whenever
+`batch_size` events are pending or `flush_interval` seconds have passed.
+
+The connection switches the database to WAL journaling and sets a busy
+timeout, so the Flask app can keep reading while the recognizer writes.
+close() flushes whatever is still buffered.
+
+Attendance is kept once per student per period (an hour unless changed
+with `python migrations.py --period-minutes`). The window is read from the
+database at start, so every writer agrees on the period keys. Rows are
+upserted on the (student_id, period) key, so a restarted or second
+recognizer only bumps last_seen/seen_count on the existing row, and a local
+PeriodCache, warmed from the database at start, skips those writes entirely
+when this process already marked the student.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import migrations
+
+DB = migrations.DB
+
+_FLUSH = object()
+_STOP = object()
+
+
+def configure_connection(conn, busy_timeout_ms=5000):
+    """WAL + busy timeout shared by every long-lived attendance.db writer"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+
+class PeriodCache:
+    """Which students were already marked in their current period"""
+
+    def __init__(self, period_seconds=migrations.DEFAULT_PERIOD_SECONDS):
+        self.period_seconds = int(period_seconds)
+        self._marked = {}
+        self._lock = threading.Lock()
+
+    def claim(self, student_id, ts):
+        """Period start if student_id is not yet marked in ts's period, else None"""
+        period = migrations.period_start(ts, self.period_seconds)
+        with self._lock:
+            if self._marked.get(student_id) == period:
+                return None
+            self._marked[student_id] = period
+        return period
+
+    def release(self, student_id, period):
+        """Undo claim() after the write it was for failed"""
+        with self._lock:
+            if self._marked.get(student_id) == period:
+                del self._marked[student_id]
+
+    def warm(self, conn, ts=None):
+        """Load students the database already has for the current period"""
+        period = migrations.period_start(time.time() if ts is None else ts, self.period_seconds)
+        # A row's ts (first sighting) lies inside its period: use the ts index
+        rows = conn.execute("SELECT student_id FROM attendance WHERE ts >= ? AND ts < ? AND period = ?",
+                            (period, period + self.period_seconds, period)).fetchall()
+        with self._lock:
+            for (student_id,) in rows:
+                self._marked.setdefault(student_id, period)
+        return len(rows)
+
+
+class AttendanceWriter:
+    def __init__(self, db_path=DB, batch_size=50, flush_interval=1.0, busy_timeout_ms=5000):
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.busy_timeout_ms = busy_timeout_ms
+        # Replaced with the database's period window in start()
+        self.periods = PeriodCache()
+        self.queue = queue.Queue()
+        self.skipped = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self._thread = None
+        self._flushed = threading.Condition()
+        self._flush_count = 0
+        self._ready = threading.Event()
+        # Why the writer thread stopped, if it failed
+        self._error = None
+
+    def start(self):
+        """Start the writer thread once the schema is migrated and the period cache warm.
+
+        Raises whatever stopped the thread from getting there, e.g.
+        sqlite3.OperationalError when the database stays locked.
+        """
+        if self._thread is None:
+            self._error = None
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+            self._thread.start()
+            self._ready.wait()
+            if self._error is not None:
+                self._thread.join()
+                self._thread = None
+                raise self._error
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def mark(self, student_id, name, timestamp=None):
+        """Queue one attendance row; the timestamp is taken now, not at flush.
+
+        Returns the timestamp, or None when the student is already marked
+        for this period and nothing was queued. Raises RuntimeError when the
+        writer thread is not running, so rows are never queued to nobody.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            if self._error is not None:
+                raise RuntimeError(f"Attendance writer stopped: {self._error}")
+            raise RuntimeError("Attendance writer is not running")
+        if timestamp is None:
+            now = datetime.now()
+            timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+            ts = int(now.timestamp())
+        else:
+            ts = migrations.epoch(timestamp)
+        period = self.periods.claim(student_id, ts)
+        if period is None:
+            self.skipped += 1
+            return None
+        self.queue.put((student_id, name, timestamp, ts, period, ts))
+        return timestamp
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def flush(self, timeout=None):
+        """Write everything queued so far and wait until it is committed"""
+        # close() may set _thread to None while we wait: keep our own reference
+        thread = self._thread
+        if thread is None:
+            return
+        with self._flushed:
+            target = self._flush_count + 1
+            self.queue.put(_FLUSH)
+            self._flushed.wait_for(lambda: self._flush_count >= target or not thread.is_alive(),
+                                   timeout=timeout)
+
+    def close(self):
+        if self._thread is not None:
+            self.queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {"written": self.written, "flushes": self.flushes, "skipped": self.skipped,
+                "pending": self.pending(), "errors": self.errors}
+
+    def _write(self, conn, batch):
+        if not batch:
+            return
+        try:
+            with conn:
+                conn.executemany(migrations.UPSERT_ATTENDANCE, batch)
+            self.written += len(batch)
+            self.flushes += 1
+            batch.clear()
+        except sqlite3.Error as e:
+            # Keep the rows and retry on the next flush
+            self.errors += 1
+            print(f"Attendance write failed ({len(batch)} rows pending): {e}")
+
+    def _run(self):
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000.0)
+            configure_connection(conn, self.busy_timeout_ms)
+            migrations.migrate(conn)
+            self.periods = PeriodCache(migrations.get_period_seconds(conn))
+            self.periods.warm(conn)
+        except Exception as e:
+            self._error = e
+            if conn is not None:
+                conn.close()
+            return
+        finally:
+            self._ready.set()
+        batch = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+                if item is _FLUSH:
+                    self._write(conn, batch)
+                    with self._flushed:
+                        self._flush_count += 1
+                        self._flushed.notify_all()
+                    deadline = None if not batch else time.monotonic() + self.flush_interval
+                    continue
+                if item is not None:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                if len(batch) >= self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                    self._write(conn, batch)
+                    deadline = None if not batch else time.monotonic() + self.flush_interval
+        except Exception as e:
+            self._error = e
+            raise
+        finally:
+            # Drain anything queued behind the stop request, then flush
+            while True:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, tuple):
+                    batch.append(item)
+            self._write(conn, batch)
+            conn.close()
+            with self._flushed:
+                self._flush_count += 1
+                self._flushed.notify_all()
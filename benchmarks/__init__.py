@@ -0,0 +1,15 @@
+"""Performance benchmarks for training, recognition and the web app.
+
+Everything runs against generated data in a work directory, never the real
+attendance.db, dataset/ or trainer/:
+
+    python -m benchmarks generate --students 500 --rows 1000000
+    python -m benchmarks run --out before.json
+    ... change something ...
+    python -m benchmarks run --out after.json
+    python -m benchmarks compare before.json after.json
+
+generate.py builds the synthetic database, face dataset and video clip,
+suites.py holds the benchmarks, and results.py writes and compares the JSON
+results.
+"""
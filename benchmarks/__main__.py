@@ -0,0 +1,119 @@
+import argparse
+import os
+import sys
+
+# Before the scripts are imported: they must use the work directory's
+# attendance.db, never a real one named by ATTENDANCE_DB
+os.environ.pop("ATTENDANCE_DB", None)
+
+from benchmarks import generate, results, suites
+
+SUITES = ["training", "model_load", "recognition", "routes"]
+
+
+def cmd_generate(args):
+    print(f"Generating {args.students} students, {args.rows} attendance rows and "
+          f"{args.samples} samples per student in {args.workdir}/ ...")
+    meta = generate.generate(args.workdir, args.students, args.rows, args.samples,
+                             args.clip_frames, args.clip_faces, args.seed)
+    print(f"Done: database in {meta['db_seconds']}s, dataset in {meta['dataset_seconds']}s, clip {meta['clip']}.")
+    return 0
+
+
+def cmd_run(args):
+    # The suites chdir into the work directory
+    args.workdir = os.path.abspath(args.workdir)
+    meta = generate.load_meta(args.workdir)
+    if meta is None:
+        print(f"No generated data in {args.workdir}/. Run `python -m benchmarks generate` first.")
+        return 1
+    selected = args.suite.split(",") if args.suite else SUITES
+    unknown = [s for s in selected if s not in SUITES]
+    if unknown:
+        print(f"Unknown suite(s): {', '.join(unknown)}. Choose from {', '.join(SUITES)}.")
+        return 1
+
+    out = {}
+    # Must come first: it imports app.py, which reads ATTENDANCE_DB at import time
+    if "routes" in selected:
+        print("routes ...")
+        out["routes"] = suites.bench_routes(os.path.join(args.workdir, "attendance.db"),
+                                            args.requests, args.export_requests)
+    if "training" in selected:
+        print("training ...")
+        out["training"] = suites.bench_training(args.workdir, args.workers)
+    if not os.path.exists(os.path.join(args.workdir, "trainer", "trainer.lbph")) and (
+            "model_load" in selected or "recognition" in selected):
+        print("Training a model first (not timed) ...")
+        with suites.in_workdir(args.workdir):
+            suites.run_train(["--workers", str(args.workers)])
+    if "model_load" in selected:
+        print("model_load ...")
+        out["model_load"] = suites.bench_model_load(args.workdir, args.repeat)
+    if "recognition" in selected:
+        print("recognition ...")
+        if args.backend == "embedding":
+            with suites.in_workdir(args.workdir):
+                suites.run_train(["--backend", "embedding", "--workers", str(args.workers)])
+        clip = os.path.abspath(args.clip) if args.clip else os.path.join(args.workdir, meta["clip"])
+        truth = [] if args.clip else meta["clip_ids"]
+        out["recognition"] = suites.bench_recognition(args.workdir, clip, truth, args.backend,
+                                                      args.nprobe, args.track)
+
+    run_meta = dict(results.environment(), generated=meta, options={
+        "suites": selected, "requests": args.requests, "export_requests": args.export_requests,
+        "repeat": args.repeat, "workers": args.workers, "backend": args.backend,
+        "nprobe": args.nprobe, "track": args.track, "clip": args.clip,
+    })
+    results.save(args.out, run_meta, out)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+def cmd_compare(args):
+    rows = results.compare(results.load(args.old), results.load(args.new), args.threshold)
+    results.print_comparison(rows)
+    worse = [r for r in rows if r[4] == "WORSE"]
+    if worse:
+        print(f"{len(worse)} metric(s) more than {args.threshold:.0%} worse.")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Generate synthetic data, run benchmarks, compare results")
+    parser.add_argument("--workdir", default="bench_data", help="directory with the generated data")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_gen = sub.add_parser("generate", help="build the synthetic database, dataset and clip")
+    p_gen.add_argument("--students", type=int, default=200)
+    p_gen.add_argument("--rows", type=int, default=1000000, help="attendance rows")
+    p_gen.add_argument("--samples", type=int, default=20, help="face images per student")
+    p_gen.add_argument("--clip-frames", type=int, default=300)
+    p_gen.add_argument("--clip-faces", type=int, default=2, help="students visible in the clip")
+    p_gen.add_argument("--seed", type=int, default=0)
+
+    p_run = sub.add_parser("run", help="run benchmark suites and write JSON results")
+    p_run.add_argument("--out", default="bench_results.json")
+    p_run.add_argument("--suite", help=f"comma-separated subset of {','.join(SUITES)}")
+    p_run.add_argument("--requests", type=int, default=50, help="requests per route")
+    p_run.add_argument("--export-requests", type=int, default=5, help="requests to /export_csv")
+    p_run.add_argument("--repeat", type=int, default=20, help="model loads to time")
+    p_run.add_argument("--workers", type=int, default=1, help="train.py --workers")
+    p_run.add_argument("--backend", choices=["lbph", "embedding"], default="lbph")
+    p_run.add_argument("--nprobe", type=int, help="IVF partitions per face (default: the model's)")
+    p_run.add_argument("--track", action="store_true", help="recognize with face tracking")
+    p_run.add_argument("--clip", help="recorded clip (video or frame directory) instead of the generated one")
+
+    p_cmp = sub.add_parser("compare", help="compare two result files")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.10, help="relative change that counts")
+
+    args = parser.parse_args(argv)
+    return {"generate": cmd_generate, "run": cmd_run, "compare": cmd_compare}[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
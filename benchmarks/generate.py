@@ -0,0 +1,248 @@
+"""Synthetic data for the benchmarks, reproducible from a seed.
+
+A work directory gets the same layout the app and scripts expect:
+
+    attendance.db   N students, M attendance rows over school-hour periods,
+                    plus a teacher account for the route benchmarks
+    dataset/        name.id.n.jpg face samples (drawn faces, one set of
+                    features per student, jittered per sample)
+    clip.avi        a recorded-style clip of a few students' faces moving
+                    across the frame (a directory of frames if no video
+                    codec is available)
+    meta.json       the parameters, and which students appear in the clip
+"""
+import json
+import math
+import os
+import shutil
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import cv2
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+import dataset_manifest
+import migrations
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "benchmark"
+FACE_SIZE = 200
+SCHOOL_HOURS = range(8, 16)    # one attendance period per hour
+ATTENDANCE_RATE = 0.8          # share of students marked in each period
+INSERT_BATCH = 20000
+
+
+def face_params(rng):
+    """Per-student face geometry and shading"""
+    return {
+        "face_w": rng.uniform(52, 66), "face_h": rng.uniform(72, 86),
+        "skin": rng.uniform(150, 215),
+        "eye_dx": rng.uniform(20, 30), "eye_y": rng.uniform(-24, -14),
+        "eye_w": rng.uniform(9, 16), "eye_h": rng.uniform(5, 9), "eye_shade": rng.uniform(20, 70),
+        "brow_gap": rng.uniform(10, 17), "brow_w": rng.uniform(12, 18),
+        "nose_len": rng.uniform(18, 32), "mouth_y": rng.uniform(34, 48),
+        "mouth_w": rng.uniform(16, 30), "mouth_h": rng.uniform(4, 10),
+        # Skin texture. Its grain, streaks and contrast differ per student,
+        # which gives each one distinct LBP statistics, like real faces
+        "texture_seed": int(rng.integers(2 ** 31)),
+        "texture_grain": rng.uniform(1.0, 4.0), "texture_stretch": rng.uniform(1.0, 4.0),
+        "texture_angle": rng.uniform(0, 180), "texture_contrast": rng.uniform(10, 30),
+    }
+
+
+def skin_texture(p, size):
+    rng = np.random.default_rng(p["texture_seed"])
+    fine = rng.normal(0, 14, (size, size)).astype(np.float32)
+    width = max(8, int(size / p["texture_grain"]))
+    coarse = rng.normal(0, 1, (max(8, int(width / p["texture_stretch"])), width)).astype(np.float32)
+    coarse = cv2.resize(coarse, (size, size), interpolation=cv2.INTER_CUBIC)
+    rotation = cv2.getRotationMatrix2D((size / 2, size / 2), p["texture_angle"], 1.0)
+    coarse = cv2.warpAffine(coarse, rotation, (size, size), borderMode=cv2.BORDER_REFLECT)
+    coarse *= p["texture_contrast"] / (coarse.std() + 1e-6)
+    return cv2.GaussianBlur(fine, (3, 3), 0) + coarse
+
+
+def backdrop(rng, height, width):
+    """Blurred noise standing in for a classroom background"""
+    return cv2.GaussianBlur(rng.integers(30, 110, (height, width)).astype(np.uint8), (31, 31), 0)
+
+
+def draw_face(p, rng=None, size=FACE_SIZE, background=None):
+    """Grayscale face for face_params p drawn over background; rng adds per-sample jitter"""
+    jitter = (lambda s: rng.uniform(-s, s)) if rng is not None else (lambda s: 0.0)
+    if background is None:
+        background = np.full((size, size), 75, np.uint8)
+    img = background.astype(np.float32)
+    scale = size / FACE_SIZE * (1 + jitter(0.05))
+    cx, cy = size / 2 + jitter(6), size / 2 + 5 + jitter(6)
+
+    def pt(dx, dy):
+        return int(round(cx + dx * scale)), int(round(cy + dy * scale))
+
+    def ax(w, h):
+        return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+    skin = p["skin"] + jitter(15)
+    cv2.ellipse(img, pt(0, 0), ax(p["face_w"], p["face_h"]), 0, 0, 360, skin, -1)
+    mask = np.zeros((size, size), np.float32)
+    cv2.ellipse(mask, pt(0, 0), ax(p["face_w"], p["face_h"]), 0, 0, 360, 1.0, -1)
+    for side in (-1, 1):
+        ex, ey = side * p["eye_dx"], p["eye_y"]
+        cv2.ellipse(img, pt(ex, ey), ax(p["eye_w"], p["eye_h"]), 0, 0, 360, p["eye_shade"], -1)
+        brow = ey - p["brow_gap"]
+        cv2.rectangle(img, pt(ex - p["brow_w"], brow - 2), pt(ex + p["brow_w"], brow + 2), skin * 0.35, -1)
+    cv2.line(img, pt(0, p["eye_y"] + 5), pt(-4, p["eye_y"] + 5 + p["nose_len"]), skin * 0.75, max(1, int(3 * scale)))
+    cv2.ellipse(img, pt(0, p["mouth_y"]), ax(p["mouth_w"], p["mouth_h"]), 0, 0, 360, skin * 0.4, -1)
+    img = cv2.GaussianBlur(img, (7, 7), 0)
+    img += skin_texture(p, size) * mask
+    if rng is not None:
+        img += rng.normal(0, 2, img.shape).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def make_dataset(dataset_dir, params, samples):
+    """Write samples jittered images per student; params maps id -> face_params"""
+    os.makedirs(dataset_dir, exist_ok=True)
+    for sid, p in params.items():
+        rng = np.random.default_rng([sid, 1])
+        for n in range(1, samples + 1):
+            face = draw_face(p, rng, background=backdrop(rng, FACE_SIZE, FACE_SIZE))
+            cv2.imwrite(os.path.join(dataset_dir, f"student{sid}.{sid}.{n}.jpg"), face)
+
+
+def period_starts(count, end_day):
+    """Epoch starts of the last count school-hour periods up to end_day"""
+    per_day = len(SCHOOL_HOURS)
+    days = math.ceil(count / per_day)
+    starts = []
+    for d in range(days - 1, -1, -1):
+        day = end_day - timedelta(days=d)
+        for hour in SCHOOL_HOURS:
+            starts.append(int(time.mktime((day.year, day.month, day.day, hour, 0, 0, 0, 0, -1))))
+    return starts[-count:]
+
+
+def make_db(db_path, students, rows, seed=0, end_day=None):
+    """Fresh attendance.db with students 1..N and rows attendance rows"""
+    rng = np.random.default_rng(seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    conn = sqlite3.connect(db_path)
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO users (email, password, full_name, role) VALUES (?, ?, ?, 'teacher')",
+                 (BENCH_EMAIL, generate_password_hash(BENCH_PASSWORD), "Benchmark Teacher"))
+    conn.executemany("INSERT INTO students (id, name, email, phone, encoding) VALUES (?, ?, ?, ?, ?)",
+                     [(sid, f"student{sid}", f"student{sid}@example.com", f"555{sid:07d}", b"")
+                      for sid in range(1, students + 1)])
+
+    per_period = max(1, min(students, int(students * ATTENDANCE_RATE)))
+    batch = []
+    written = 0
+    for start in period_starts(math.ceil(rows / per_period), end_day or date.today()):
+        present = rng.choice(students, min(per_period, rows - written), replace=False) + 1
+        offsets = rng.integers(0, 15 * 60, len(present))
+        for sid, offset in zip(present.tolist(), offsets.tolist()):
+            ts = start + offset
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+            batch.append((sid, f"student{sid}", timestamp, ts, migrations.period_start(ts), ts))
+        written += len(present)
+        if len(batch) >= INSERT_BATCH:
+            conn.executemany(migrations.UPSERT_ATTENDANCE, batch)
+            batch = []
+    conn.executemany(migrations.UPSERT_ATTENDANCE, batch)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return written
+
+
+def make_clip(path, params, frames, size=(640, 480), fps=25, seed=0):
+    """Clip of the given students' faces drifting across a static background.
+
+    Written as MJPG video; falls back to a directory of JPEG frames (which
+    recognize_cv.py also reads) if this OpenCV build cannot write video.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = backdrop(rng, height, width)
+    faces = list(params.values())
+    face = FACE_SIZE
+    # Each face drifts inside its own vertical lane so faces do not overlap
+    lane = max(face, width // max(1, len(faces)))
+    low = np.array([[min(i * lane, width - face), 0] for i in range(len(faces))], dtype=np.float64)
+    high = np.minimum(low + [lane - face, height - face], [width - face, height - face])
+    positions = rng.uniform(low, high)
+    velocity = rng.uniform(-3, 3, (len(faces), 2))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    frame_dir = None
+    if not writer.isOpened():
+        frame_dir = os.path.splitext(path)[0]
+        shutil.rmtree(frame_dir, ignore_errors=True)
+        os.makedirs(frame_dir)
+    try:
+        for n in range(frames):
+            frame = background.copy()
+            for i, p in enumerate(faces):
+                positions[i] += velocity[i]
+                for axis in (0, 1):
+                    if not low[i, axis] <= positions[i, axis] <= high[i, axis]:
+                        velocity[i, axis] *= -1
+                        positions[i, axis] = min(max(positions[i, axis], low[i, axis]), high[i, axis])
+                x, y = positions[i].astype(int)
+                # Redrawn every frame: a little pose and sensor noise, like a camera
+                frame[y:y + face, x:x + face] = draw_face(p, rng, background=frame[y:y + face, x:x + face])
+            bgr = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            if frame_dir:
+                cv2.imwrite(os.path.join(frame_dir, f"{n:06d}.jpg"), bgr)
+            else:
+                writer.write(bgr)
+    finally:
+        writer.release()
+    return frame_dir or path
+
+
+def generate(workdir, students=200, rows=1000000, samples=20, clip_frames=300, clip_faces=2, seed=0):
+    """Build the whole work directory; returns its meta.json contents"""
+    os.makedirs(workdir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    params = {sid: face_params(rng) for sid in range(1, students + 1)}
+
+    started = time.time()
+    written = make_db(os.path.join(workdir, "attendance.db"), students, rows, seed)
+    db_seconds = time.time() - started
+
+    started = time.time()
+    dataset_dir = os.path.join(workdir, "dataset")
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    make_dataset(dataset_dir, params, samples)
+    conn = sqlite3.connect(os.path.join(workdir, "attendance.db"))
+    dataset_manifest.rescan(conn, dataset_dir)
+    conn.close()
+    dataset_seconds = time.time() - started
+
+    clip_ids = sorted(rng.choice(students, min(clip_faces, students), replace=False).astype(int) + 1)
+    clip = make_clip(os.path.join(workdir, "clip.avi"), {sid: params[sid] for sid in clip_ids},
+                     clip_frames, seed=seed)
+
+    # Model, caches and packed samples from an earlier run are stale now
+    shutil.rmtree(os.path.join(workdir, "trainer"), ignore_errors=True)
+    meta = {
+        "students": students, "rows": written, "samples": samples, "seed": seed,
+        "clip": os.path.relpath(clip, workdir), "clip_frames": clip_frames, "clip_ids": [int(s) for s in clip_ids],
+        "db_seconds": round(db_seconds, 3), "dataset_seconds": round(dataset_seconds, 3),
+    }
+    with open(os.path.join(workdir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def load_meta(workdir):
+    path = os.path.join(workdir, "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
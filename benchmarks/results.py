@@ -0,0 +1,105 @@
+"""JSON benchmark results, and comparing two runs.
+
+A results file holds "meta" (versions, machine, git commit, generator and
+run parameters) and "results" (one dict of metrics per suite). compare()
+lines up the timing metrics of two files: *_ms and *_seconds are better
+when lower, fps when higher. Counts, sizes and max_ms (one outlier) are
+not compared, and differences below a small absolute floor are treated as
+noise whatever their relative size.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Absolute differences that never count as better or worse
+NOISE_FLOOR = {"_ms": 1.0, "_seconds": 0.05, "fps": 0.5}
+
+
+def environment():
+    import cv2
+
+    meta = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": None,
+    }
+    try:
+        repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        meta["git_commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo,
+                                            capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return meta
+
+
+def save(path, meta, results):
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def flatten(results, prefix=""):
+    """{"routes": {"/dashboard": {"p50_ms": 1}}} -> {"routes./dashboard.p50_ms": 1}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def direction(metric):
+    """-1 if lower is better, 1 if higher is better, None if not a timing"""
+    last = metric.rsplit(".", 1)[-1]
+    if last == "max_ms":
+        return None
+    if last.endswith("_ms") or last.endswith("_seconds"):
+        return -1
+    if last == "fps":
+        return 1
+    return None
+
+
+def compare(old, new, threshold=0.10):
+    """Rows of (metric, old, new, relative change, verdict) for shared timing metrics"""
+    old_flat, new_flat = flatten(old["results"]), flatten(new["results"])
+    rows = []
+    for metric in sorted(set(old_flat) & set(new_flat)):
+        better = direction(metric)
+        if better is None:
+            continue
+        before, after = old_flat[metric], new_flat[metric]
+        change = (after - before) / before if before else 0.0
+        floor = next(v for k, v in NOISE_FLOOR.items() if metric.endswith(k))
+        if abs(after - before) < floor:
+            verdict = ""
+        elif change * better > threshold:
+            verdict = "better"
+        elif change * better < -threshold:
+            verdict = "WORSE"
+        else:
+            verdict = ""
+        rows.append((metric, before, after, change, verdict))
+    return rows
+
+
+def print_comparison(rows, out=sys.stdout):
+    width = max([len(r[0]) for r in rows] + [6])
+    print(f"{'metric':<{width}}  {'old':>12}  {'new':>12}  {'change':>8}", file=out)
+    for metric, before, after, change, verdict in rows:
+        print(f"{metric:<{width}}  {before:>12.3f}  {after:>12.3f}  {change:>+8.1%}  {verdict}", file=out)
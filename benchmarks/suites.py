@@ -0,0 +1,196 @@
+"""The benchmarks. Each returns a dict of metrics for the JSON results.
+
+Timings are wall-clock: *_seconds for one-off operations, *_ms dicts of
+percentiles for repeated ones. They run inside the generated work
+directory, since train.py and recognize_cv.py use paths relative to it.
+"""
+import contextlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+
+@contextlib.contextmanager
+def in_workdir(workdir):
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if len(samples) == 0:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p90_ms": round(float(np.percentile(samples, 90)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+
+
+def run_train(args):
+    """train.main(args) with its output captured; returns (seconds, RESULT stats)"""
+    import train
+
+    out = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        status = train.main(list(args) + ["--progress"])
+    seconds = time.perf_counter() - started
+    if status:
+        raise RuntimeError("train.py failed:\n" + out.getvalue())
+    stats = {}
+    for line in out.getvalue().splitlines():
+        if line.startswith("RESULT "):
+            stats = json.loads(line[len("RESULT "):])
+    return seconds, stats
+
+
+def bench_training(workdir, workers=1):
+    """Full train without, then with, the face cache, and a no-op incremental run"""
+    with in_workdir(workdir):
+        for path in ("trainer/face_cache.db", "trainer/trained_files.json"):
+            if os.path.exists(path):
+                os.remove(path)
+        cold, stats = run_train(["--workers", str(workers)])
+        warm, warm_stats = run_train(["--workers", str(workers)])
+        noop, _ = run_train(["--incremental"])
+    return {
+        "images": stats.get("images"),
+        "samples": stats.get("samples"),
+        "full_seconds": round(cold, 3),
+        "full_load_seconds": stats.get("load_seconds"),
+        "full_train_seconds": stats.get("train_seconds"),
+        "cached_seconds": round(warm, 3),
+        "cached_load_seconds": warm_stats.get("load_seconds"),
+        "incremental_noop_seconds": round(noop, 3),
+    }
+
+
+def bench_model_load(workdir, repeat=20):
+    """Binary model (memory-mapped) load against parsing the trainer.yml export"""
+    import cv2
+    import model_store
+
+    with in_workdir(workdir):
+        model = model_store.load_model(model_store.BINARY_MODEL_PATH)
+        if not os.path.exists(model_store.YAML_MODEL_PATH):
+            model_store.export_yaml(model, model_store.YAML_MODEL_PATH)
+        binary_ms = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            model_store.load_model(model_store.BINARY_MODEL_PATH)
+            binary_ms.append((time.perf_counter() - started) * 1000)
+        yaml_ms = []
+        for _ in range(max(1, repeat // 10)):
+            started = time.perf_counter()
+            cv2.face.LBPHFaceRecognizer_create().read(model_store.YAML_MODEL_PATH)
+            yaml_ms.append((time.perf_counter() - started) * 1000)
+        return {
+            "samples": len(model),
+            "binary_bytes": os.path.getsize(model_store.BINARY_MODEL_PATH),
+            "yaml_bytes": os.path.getsize(model_store.YAML_MODEL_PATH),
+            "binary_ms": percentiles(binary_ms),
+            "yaml_ms": percentiles(yaml_ms),
+        }
+
+
+def bench_recognition(workdir, clip, truth=(), backend="lbph", nprobe=None, track=False):
+    """Per-frame detect + recognize latency and fps over the clip.
+
+    Frames are decoded up front so only processing is timed. truth is the
+    set of students in the clip; faces recognized as anyone else count as
+    wrong.
+    """
+    import cv2
+    import model_store
+    import recognize_cv
+    from tracking import FaceTracker
+
+    with in_workdir(workdir):
+        if backend == "embedding":
+            import embeddings
+            recognizer = embeddings.EmbeddingRecognizer.from_db(recognize_cv.DB)
+        else:
+            recognizer = model_store.load_recognizer()
+            if nprobe is not None and getattr(recognizer, "index", None) is not None:
+                recognizer.nprobe = nprobe
+        face_cascade = recognize_cv.create_face_cascade()
+        tracker = FaceTracker(recognize_cv.detect_faces, face_cascade) if track else None
+        processor = recognize_cv.FrameProcessor(recognizer, face_cascade, recognize_cv.load_id_name_map(), tracker)
+        frames = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in recognize_cv.iter_frames(clip)]
+
+    truth = set(truth)
+    frame_ms = []
+    faces = known = wrong = 0
+    started = time.perf_counter()
+    for gray in frames:
+        t = time.perf_counter()
+        results = processor.process(gray)
+        frame_ms.append((time.perf_counter() - t) * 1000)
+        for _, sid, _, _ in results:
+            faces += 1
+            if sid is not None:
+                known += 1
+                wrong += truth and sid not in truth
+    total = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "index": getattr(recognizer, "index", None) is not None,
+        "frames": len(frames),
+        "faces": faces,
+        "known_rate": round(known / faces, 4) if faces else None,
+        "wrong": int(wrong),
+        "fps": round(len(frames) / total, 2) if total else None,
+        "frame_ms": percentiles(frame_ms),
+        "detect_ms_per_frame": round(processor.detect_seconds * 1000 / max(1, len(frames)), 3),
+        "predict_ms_per_face": round(processor.predict_seconds * 1000 / max(1, processor.predictions), 3),
+    }
+
+
+ROUTES = ["/dashboard", "/attendance", "/api/statistics", "/export_csv"]
+
+
+def bench_routes(db_path, requests=50, export_requests=5):
+    """Latency percentiles of the key routes through the Flask test client.
+
+    app.py reads ATTENDANCE_DB when it is imported, so this has to run
+    before anything else imports app. The first request of each route is
+    reported on its own (cold caches), the rest as percentiles; response
+    bodies are read in full, so /export_csv streams the whole table.
+    """
+    from benchmarks.generate import BENCH_EMAIL, BENCH_PASSWORD
+
+    os.environ["ATTENDANCE_DB"] = os.path.abspath(db_path)
+    import app as appmod
+    if os.path.abspath(appmod.DB_PATH) != os.path.abspath(db_path):
+        raise RuntimeError("app was imported before the benchmark set ATTENDANCE_DB")
+
+    client = appmod.app.test_client()
+    response = client.post("/login", data={"email": BENCH_EMAIL, "password": BENCH_PASSWORD, "role": "teacher"})
+    if response.status_code != 302:
+        raise RuntimeError(f"benchmark login failed ({response.status_code})")
+
+    results = {}
+    for route in ROUTES:
+        count = export_requests if route == "/export_csv" else requests
+        timings = []
+        size = 0
+        for _ in range(count + 1):
+            started = time.perf_counter()
+            response = client.get(route)
+            size = len(response.get_data())
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"{route} returned {response.status_code}")
+        results[route] = dict(percentiles(timings[1:]), first_ms=round(timings[0], 3), bytes=size)
+    return results
@@ -0,0 +1,117 @@
+"""Small in-process caches for read-mostly responses and rows.
+
+ResponseCache entries are tagged with the database's data version, a counter that
+migration 5's triggers bump on every attendance or students write. A lookup
+only hits while the version is unchanged and the entry is younger than its
+TTL, so writes from any process (recognizers, other app workers) invalidate
+it without any messaging. Each entry carries an ETag computed from its
+payload, letting clients revalidate with If-None-Match for a 304.
+
+LRUCache is a plain bounded map for rows looked up on every request, such
+as the logged-in user; callers drop entries they change.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 30.0
+MAX_ENTRIES = 1024
+
+
+def data_version(conn):
+    row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+class CacheEntry:
+    def __init__(self, version, payload, ttl):
+        self.version = version
+        self.payload = payload
+        self.expires_at = time.monotonic() + ttl
+        body = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        self.etag = hashlib.sha1(body).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, version, payload):
+        entry = CacheEntry(version, payload, self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def fetch(self, key, version, build):
+        """Cached entry for key, building the payload with build() on a miss"""
+        entry = self.get(key, version)
+        if entry is None:
+            entry = self.put(key, version, build())
+        return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                    "ttl": self.ttl}
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU map with an optional TTL per entry"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and (item[1] is None or item[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
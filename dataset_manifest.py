@@ -0,0 +1,180 @@
+"""Index of the face images in dataset/, kept in the dataset_images table.
+
+Sample files are named name.student_id.sample_index.ext. Instead of listing
+(and splitting the names of) every file in dataset/ whenever the id -> name
+map, the next sample index or a student's files are needed, those are read
+from this table with indexed lookups. Everything that writes or deletes
+dataset images (register_old, register_cv, delete_student) updates it.
+
+Images copied into dataset/ by hand are picked up by a rescan (a stat per
+file; only new or changed files are hashed). train.py and the sample store
+import rescan first; request handlers only use the indexed queries. To run
+one directly:
+
+    python dataset_manifest.py            # add new files, drop missing ones, refresh changed ones
+    python dataset_manifest.py --verify   # also re-hash every file and repair stale entries
+"""
+import hashlib
+import os
+import sqlite3
+
+import migrations
+
+DB = migrations.DB
+DATASET_DIR = 'dataset'
+HASH_CHUNK = 1024 * 1024
+
+
+def parse_filename(filename):
+    """'name.sid.index.ext' -> (name, sid, index); None for other files"""
+    parts = filename.split(".")
+    if len(parts) < 3:
+        return None
+    try:
+        sid = int(parts[1])
+    except ValueError:
+        return None
+    try:
+        index = int(parts[2])
+    except ValueError:
+        index = None
+    return parts[0], sid, index
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record_image(conn, filename, dataset_dir=DATASET_DIR, st=None):
+    """Add or refresh one dataset file in the manifest; False if not a sample"""
+    parsed = parse_filename(filename)
+    if parsed is None:
+        return False
+    name, sid, index = parsed
+    path = os.path.join(dataset_dir, filename)
+    st = st or os.stat(path)
+    conn.execute('''
+        INSERT INTO dataset_images (path, student_id, name, sample_index, size, mtime_ns, hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (path) DO UPDATE SET
+            student_id = excluded.student_id, name = excluded.name, sample_index = excluded.sample_index,
+            size = excluded.size, mtime_ns = excluded.mtime_ns, hash = excluded.hash
+    ''', (filename, sid, name, index, st.st_size, st.st_mtime_ns, file_hash(path)))
+    return True
+
+
+def next_sample_index(conn, student_id):
+    row = conn.execute("SELECT MAX(sample_index) FROM dataset_images WHERE student_id = ?",
+                       (student_id,)).fetchone()
+    return (row[0] or 0) + 1
+
+
+def next_free_index(conn, student_id, name, ext="jpg", dataset_dir=DATASET_DIR):
+    """next_sample_index(), skipping names taken by files not indexed yet"""
+    index = next_sample_index(conn, student_id)
+    while os.path.exists(os.path.join(dataset_dir, f"{name}.{student_id}.{index}.{ext}")):
+        index += 1
+    return index
+
+
+def student_images(conn, student_id):
+    return [r[0] for r in conn.execute(
+        "SELECT path FROM dataset_images WHERE student_id = ? ORDER BY sample_index", (student_id,))]
+
+
+def remove_student(conn, student_id):
+    """Drop a student's manifest rows; returns the file names they had"""
+    paths = student_images(conn, student_id)
+    conn.execute("DELETE FROM dataset_images WHERE student_id = ?", (student_id,))
+    return paths
+
+
+def id_name_map(conn):
+    # Bare column with MAX(): the name from each student's newest image
+    return {sid: name for sid, name, _ in conn.execute(
+        "SELECT student_id, name, MAX(id) FROM dataset_images GROUP BY student_id")}
+
+
+def images(conn):
+    """{file name: [size, mtime_ns]} for every indexed image, sorted by name"""
+    return {path: [size, mtime_ns] for path, size, mtime_ns in conn.execute(
+        "SELECT path, size, mtime_ns FROM dataset_images ORDER BY path")}
+
+
+def rescan(conn, dataset_dir=DATASET_DIR, verify=False):
+    """Reconcile the manifest with the files on disk; returns what changed.
+
+    Files whose size and mtime still match are left alone unless verify is
+    set, in which case every file is re-hashed.
+    """
+    known = {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest in
+             conn.execute("SELECT path, size, mtime_ns, hash FROM dataset_images")}
+    stats = {"added": 0, "updated": 0, "removed": 0, "repaired": 0, "unchanged": 0}
+    on_disk = set()
+    if os.path.isdir(dataset_dir):
+        for entry in os.scandir(dataset_dir):
+            if not entry.is_file() or parse_filename(entry.name) is None:
+                continue
+            on_disk.add(entry.name)
+            st = entry.stat()
+            old = known.get(entry.name)
+            if old is None:
+                record_image(conn, entry.name, dataset_dir, st)
+                stats["added"] += 1
+            elif old[:2] != (st.st_size, st.st_mtime_ns):
+                record_image(conn, entry.name, dataset_dir, st)
+                stats["updated"] += 1
+            elif verify and file_hash(entry.path) != old[2]:
+                record_image(conn, entry.name, dataset_dir, st)
+                stats["repaired"] += 1
+            else:
+                stats["unchanged"] += 1
+    missing = [(path,) for path in known if path not in on_disk]
+    conn.executemany("DELETE FROM dataset_images WHERE path = ?", missing)
+    stats["removed"] = len(missing)
+    conn.commit()
+    return stats
+
+
+def ensure_manifest(conn, dataset_dir=DATASET_DIR):
+    """Build the manifest on first use from whatever is already in dataset/"""
+    if conn.execute("SELECT 1 FROM dataset_images LIMIT 1").fetchone() is None:
+        rescan(conn, dataset_dir)
+
+
+def connect(db_path=DB, dataset_dir=DATASET_DIR):
+    """Connection with the schema migrated and the manifest bootstrapped"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    migrations.migrate(conn)
+    ensure_manifest(conn, dataset_dir)
+    return conn
+
+
+def load_id_name_map(db_path=DB, dataset_dir=DATASET_DIR):
+    conn = connect(db_path, dataset_dir)
+    try:
+        return id_name_map(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rescan dataset/ into the dataset_images manifest")
+    parser.add_argument("--db", default=DB)
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--verify", action="store_true", help="re-hash every file and repair mismatches")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    migrations.migrate(conn)
+    stats = rescan(conn, args.dataset, verify=args.verify)
+    total = conn.execute("SELECT COUNT(*), COUNT(DISTINCT student_id) FROM dataset_images").fetchone()
+    conn.close()
+    print(", ".join(f"{k}: {v}" for k, v in stats.items()))
+    print(f"Manifest has {total[0]} images of {total[1]} students.")
@@ -0,0 +1,137 @@
+"""Pooled, tuned SQLite connections for app.py.
+
+Opening a connection per query (and another in teacher_required) costs a
+file open, schema parse and an empty statement cache every time. Instead a
+small per-process pool keeps connections open, each configured once with
+WAL journaling, a busy timeout, synchronous=NORMAL, a larger page cache and
+memory-mapped I/O, plus a bigger prepared-statement cache that stays warm
+because the connection is reused.
+
+Inside a request, get_connection() always hands out the same connection;
+the routes' own conn.close() calls only roll back uncommitted work, and the
+connection goes back to the pool on app-context teardown. Outside a request
+close() returns it straight away. Pools are per process (rebuilt after a
+fork) and hand a connection to one thread at a time, so this is safe under
+threaded and multi-worker servers.
+"""
+import os
+import queue
+import sqlite3
+import threading
+
+from flask import g, has_app_context
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16384          # page cache per connection
+MMAP_SIZE = 256 * 1024 * 1024   # memory-mapped reads
+STATEMENT_CACHE = 256
+
+
+def configure(conn, busy_timeout_ms=BUSY_TIMEOUT_MS):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+class PooledConnection:
+    """sqlite3.Connection proxy whose close() hands the connection back"""
+
+    def __init__(self, pool, conn, request_scoped):
+        self._pool = pool
+        self._conn = conn
+        self._request_scoped = request_scoped
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        if self._conn is None:
+            return
+        # Same effect as sqlite3 close(): uncommitted changes are discarded
+        if self._conn.in_transaction:
+            self._conn.rollback()
+        if not self._request_scoped:
+            self.release()
+
+    def release(self):
+        if self._conn is not None:
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+class ConnectionPool:
+    def __init__(self, db_path, size=POOL_SIZE, timeout=30.0):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000.0,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        configure(conn)
+        return conn
+
+    def acquire(self):
+        if os.getpid() != self._pid:
+            # Never share SQLite handles across fork(); start a fresh pool
+            self._reset()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("timed out waiting for a pooled database connection")
+
+    def release(self, conn):
+        if os.getpid() != self._pid:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def connection(self):
+        """Request-scoped connection inside a Flask app context, else a pooled one"""
+        if has_app_context():
+            pooled = g.get("_db_conn")
+            if pooled is None or pooled._conn is None:
+                pooled = PooledConnection(self, self.acquire(), request_scoped=True)
+                g._db_conn = pooled
+            return pooled
+        return PooledConnection(self, self.acquire(), request_scoped=False)
+
+    def teardown(self, exc=None):
+        pooled = g.pop("_db_conn", None)
+        if pooled is not None:
+            pooled.release()
+
+    def init_app(self, app):
+        app.teardown_appcontext(self.teardown)
@@ -0,0 +1,128 @@
+"""Face-embedding recognizer backend, an alternative to LBPH.
+
+`python train.py --backend embedding` computes a 128-d face_recognition
+(dlib) encoding for every face sample and stores each student's encodings
+in students.encoding as raw little-endian float32 rows, not pickles. At
+startup EmbeddingRecognizer stacks every student's rows into one contiguous
+matrix. All faces of a frame are encoded in one face_recognition call and
+matched against every stored encoding with a single matrix product.
+
+predict() returns (student_id, distance * 100), so lower is better, as
+with LBPH. A face matches when that is below TOLERANCE * 100.
+"""
+import sqlite3
+
+import numpy as np
+
+ENCODING_DIM = 128
+TOLERANCE = 0.6   # face_recognition's default match distance
+DTYPE = np.dtype("<f4")
+
+
+def to_blob(encodings):
+    return np.asarray(encodings, dtype=DTYPE).reshape(-1, ENCODING_DIM).tobytes()
+
+
+def from_blob(blob):
+    """(n, 128) float32 rows, or None for placeholders and legacy pickles"""
+    if not blob or len(blob) % (ENCODING_DIM * DTYPE.itemsize):
+        return None
+    return np.frombuffer(blob, dtype=DTYPE).reshape(-1, ENCODING_DIM)
+
+
+def encode_faces(gray, boxes):
+    """Encodings for the given (x, y, w, h) face boxes of one grayscale image"""
+    import cv2
+    import face_recognition
+
+    if len(boxes) == 0:
+        return np.zeros((0, ENCODING_DIM), dtype=np.float32)
+    rgb = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+    # face_recognition wants (top, right, bottom, left); boxes are already
+    # detected, so it skips its own detector
+    locations = [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in boxes]
+    encodings = face_recognition.face_encodings(rgb, known_face_locations=locations)
+    return np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+
+
+def compute_student_encodings(face_samples, ids, progress=None):
+    """{student_id: (n, 128) array} for cropped face samples"""
+    grouped = {}
+    for done, (crop, sid) in enumerate(zip(face_samples, ids), 1):
+        h, w = crop.shape[:2]
+        grouped.setdefault(int(sid), []).append(encode_faces(crop, [(0, 0, w, h)]))
+        if progress and (done % 16 == 0 or done == len(ids)):
+            progress(done, len(ids))
+    return {sid: np.concatenate(rows) for sid, rows in grouped.items()}
+
+
+def save_encodings(conn, encodings, names):
+    """Store each student's encodings, adding students that are not in the table yet"""
+    conn.executemany('''
+        INSERT INTO students (id, name, encoding) VALUES (?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET encoding = excluded.encoding
+    ''', [(sid, names.get(sid, f"ID{sid}"), to_blob(rows)) for sid, rows in encodings.items()])
+    conn.commit()
+
+
+def load_matrix(conn):
+    """All stored encodings as one contiguous (N, 128) matrix plus their student ids"""
+    blocks, labels = [], []
+    for sid, blob in conn.execute("SELECT id, encoding FROM students ORDER BY id"):
+        rows = from_blob(blob)
+        if rows is not None and len(rows):
+            blocks.append(rows)
+            labels.append(np.full(len(rows), sid, dtype=np.int32))
+    if not blocks:
+        return np.zeros((0, ENCODING_DIM), dtype=np.float32), np.zeros(0, dtype=np.int32)
+    return np.ascontiguousarray(np.concatenate(blocks), dtype=np.float32), np.concatenate(labels)
+
+
+class EmbeddingRecognizer:
+    confidence_threshold = TOLERANCE * 100
+
+    def __init__(self, matrix, labels, tolerance=TOLERANCE):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.tolerance = tolerance
+        self.confidence_threshold = tolerance * 100
+        self._norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+
+    @classmethod
+    def from_db(cls, db_path, tolerance=TOLERANCE):
+        conn = sqlite3.connect(db_path)
+        try:
+            matrix, labels = load_matrix(conn)
+        finally:
+            conn.close()
+        return cls(matrix, labels, tolerance)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def distances(self, encodings):
+        """(faces, stored encodings) euclidean distances in one matrix product"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        squared = (np.einsum("ij,ij->i", encodings, encodings)[:, None] + self._norms[None, :]
+                   - 2.0 * encodings @ self.matrix.T)
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    def match(self, encodings):
+        """[(student_id, distance * 100)] for each encoding; -1/inf if nothing is stored"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(self.labels) == 0:
+            return [(-1, float("inf"))] * len(encodings)
+        dist = self.distances(encodings)
+        best = dist.argmin(axis=1)
+        return [(int(self.labels[j]), float(dist[i, j]) * 100) for i, j in enumerate(best)]
+
+    def predict(self, gray):
+        """(student_id, distance * 100) for a cropped face, like LBPH predict()"""
+        h, w = gray.shape[:2]
+        return self.match(encode_faces(gray, [(0, 0, w, h)]))[0]
+
+    def predict_many(self, gray, boxes):
+        """Encode all faces of a frame at once and match them together"""
+        if len(boxes) == 0:
+            return []
+        return self.match(encode_faces(gray, boxes))
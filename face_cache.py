@@ -0,0 +1,98 @@
+"""Persistent cache of train.py's per-image face detections.
+
+Decoding every dataset image and running the Haar cascade over it dominates
+training time, and the result only changes when the file does. The cache
+keeps, per image, the student id and the cropped faces (raw grayscale
+pixels), keyed on the file name plus the size and mtime recorded in the
+dataset manifest. A retrain then only decodes and detects images that are
+new or changed; images whose detection found no face are cached too.
+
+It lives in its own SQLite file next to the model, since it is derived data
+that can be deleted at any time.
+"""
+import os
+import sqlite3
+
+import numpy as np
+
+CACHE_PATH = "trainer/face_cache.db"
+
+# get() result for an image that has to be (re)detected
+MISS = object()
+
+
+class FaceCache:
+    def __init__(self, path=CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            student_id INTEGER,
+            faces INTEGER NOT NULL
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS faces (
+            path TEXT NOT NULL,
+            face_index INTEGER NOT NULL,
+            h INTEGER NOT NULL,
+            w INTEGER NOT NULL,
+            pixels BLOB NOT NULL,
+            PRIMARY KEY (path, face_index)
+        ) WITHOUT ROWID
+        ''')
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, stamp):
+        """extract_faces() result cached for this version of the file, or MISS"""
+        size, mtime_ns = stamp
+        row = self.conn.execute(
+            "SELECT student_id, faces FROM images WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, size, mtime_ns)).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        student_id, count = row
+        if student_id is None:
+            return None
+        crops = []
+        if count:
+            for h, w, pixels in self.conn.execute(
+                    "SELECT h, w, pixels FROM faces WHERE path = ? ORDER BY face_index", (path,)):
+                crops.append(np.frombuffer(pixels, dtype=np.uint8).reshape(h, w))
+        return student_id, crops
+
+    def put(self, path, stamp, result):
+        """Store an extract_faces() result (None for unreadable/unnamed files)"""
+        size, mtime_ns = stamp
+        student_id, crops = result if result is not None else (None, [])
+        self.conn.execute("DELETE FROM faces WHERE path = ?", (path,))
+        self.conn.execute("INSERT OR REPLACE INTO images (path, size, mtime_ns, student_id, faces) "
+                          "VALUES (?, ?, ?, ?, ?)", (path, size, mtime_ns, student_id, len(crops)))
+        self.conn.executemany(
+            "INSERT INTO faces (path, face_index, h, w, pixels) VALUES (?, ?, ?, ?, ?)",
+            [(path, i, crop.shape[0], crop.shape[1], np.ascontiguousarray(crop, dtype=np.uint8).tobytes())
+             for i, crop in enumerate(crops)])
+
+    def prune(self, keep):
+        """Forget images that are no longer in the dataset"""
+        keep = set(keep)
+        gone = [(path,) for (path,) in self.conn.execute("SELECT path FROM images") if path not in keep]
+        self.conn.executemany("DELETE FROM faces WHERE path = ?", gone)
+        self.conn.executemany("DELETE FROM images WHERE path = ?", gone)
+        return len(gone)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,419 @@
+"""Versioned schema migrations for attendance.db.
+
+The schema version lives in `PRAGMA user_version`. migrate() applies every
+migration above it in order, each inside a `BEGIN IMMEDIATE` transaction so
+two processes starting together (app workers, recognizers) don't both apply
+it. Backfills over attendance commit per batch instead, to keep write locks
+short on a live database; steps are idempotent, so a migration interrupted
+part-way simply resumes.
+
+    python migrations.py            # migrate attendance.db
+    python migrations.py --status   # show current/latest version
+    python migrations.py --period-minutes 45   # change the attendance period
+"""
+import calendar
+import os
+import sqlite3
+import time
+
+# ATTENDANCE_DB points the scripts at another database, as it does app.py
+DB = os.environ.get("ATTENDANCE_DB") or 'attendance.db'
+BACKFILL_BATCH = 5000
+# A student is marked at most once per period (see m006). The window is a
+# database setting (m008) so every writer computes the same period keys
+DEFAULT_PERIOD_SECONDS = 3600
+PERIOD_SETTING = "attendance_period_seconds"
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def add_column(conn, table, column, decl):
+    if column not in columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def backfill(conn, sql, batch_size=BACKFILL_BATCH):
+    """Run `sql` (with :lo/:hi id bounds) over attendance in committed batches.
+
+    Commits the migration's work so far, releases the write lock between
+    batches, and returns with a new transaction open.
+    """
+    conn.commit()
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM attendance").fetchone()[0]
+    lo = 0
+    while lo < max_id:
+        hi = lo + batch_size
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(sql, {"lo": lo, "hi": hi})
+        conn.commit()
+        lo = hi
+    conn.execute("BEGIN IMMEDIATE")
+
+
+def m001_baseline(conn):
+    """Tables app.py and db_setup.py used to create ad hoc"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        role TEXT NOT NULL,
+        phone TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS otp_verification (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone_or_email TEXT UNIQUE NOT NULL,
+        otp TEXT NOT NULL,
+        method TEXT NOT NULL,
+        verification_data TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        name TEXT NOT NULL,
+        encoding BLOB,
+        phone TEXT,
+        email TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        name TEXT,
+        timestamp TEXT,
+        status TEXT DEFAULT 'present',
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )
+    ''')
+    # Databases created by the old db_setup.py lack the newer columns
+    add_column(conn, "students", "user_id", "INTEGER REFERENCES users(id)")
+    add_column(conn, "students", "phone", "TEXT")
+    add_column(conn, "students", "email", "TEXT")
+    add_column(conn, "students", "created_at", "TIMESTAMP")
+    add_column(conn, "attendance", "status", "TEXT DEFAULT 'present'")
+
+    from training_jobs import create_table
+    create_table(conn)
+
+
+def m002_attendance_indexes(conn):
+    """Integer epoch timestamps and indexes for the dashboard queries"""
+    add_column(conn, "attendance", "ts", "INTEGER")
+    # Writers that only fill the TEXT timestamp get ts computed for them
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS attendance_fill_ts AFTER INSERT ON attendance
+    WHEN NEW.ts IS NULL AND NEW.timestamp IS NOT NULL
+    BEGIN
+        UPDATE attendance SET ts = CAST(strftime('%s', NEW.timestamp, 'utc') AS INTEGER)
+        WHERE id = NEW.id;
+    END
+    ''')
+    # Timestamps are local time; the 'utc' modifier makes ts a true epoch
+    backfill(conn, '''
+        UPDATE attendance SET ts = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+        WHERE id > :lo AND id <= :hi AND ts IS NULL AND timestamp IS NOT NULL
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_ts ON attendance(student_id, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance(ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_user_id ON students(user_id)")
+
+
+def m003_search_index(conn):
+    """FTS5 indexes behind the /students and /attendance search boxes"""
+    try:
+        # External-content tables: the text lives once, in students/attendance
+        conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+            name, email, phone, content='students', content_rowid='id', prefix='2 3')
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5: search.py falls back to LIKE
+        print(f"Skipping search index: {e}")
+        return
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS attendance_fts USING fts5(
+        name, student_id, content='attendance', content_rowid='id', prefix='2 3')
+    ''')
+    for sql in (
+        '''CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+            INSERT INTO students_fts(rowid, name, email, phone) VALUES (NEW.id, NEW.name, NEW.email, NEW.phone);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+            INSERT INTO students_fts(students_fts, rowid, name, email, phone)
+            VALUES ('delete', OLD.id, OLD.name, OLD.email, OLD.phone);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF id, name, email, phone ON students BEGIN
+            INSERT INTO students_fts(students_fts, rowid, name, email, phone)
+            VALUES ('delete', OLD.id, OLD.name, OLD.email, OLD.phone);
+            INSERT INTO students_fts(rowid, name, email, phone) VALUES (NEW.id, NEW.name, NEW.email, NEW.phone);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS attendance_fts_insert AFTER INSERT ON attendance BEGIN
+            INSERT INTO attendance_fts(rowid, name, student_id) VALUES (NEW.id, NEW.name, NEW.student_id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS attendance_fts_delete AFTER DELETE ON attendance BEGIN
+            INSERT INTO attendance_fts(attendance_fts, rowid, name, student_id)
+            VALUES ('delete', OLD.id, OLD.name, OLD.student_id);
+        END''',
+        # Not on ts: attendance_fill_ts updates every new row
+        '''CREATE TRIGGER IF NOT EXISTS attendance_fts_update AFTER UPDATE OF id, name, student_id ON attendance BEGIN
+            INSERT INTO attendance_fts(attendance_fts, rowid, name, student_id)
+            VALUES ('delete', OLD.id, OLD.name, OLD.student_id);
+            INSERT INTO attendance_fts(rowid, name, student_id) VALUES (NEW.id, NEW.name, NEW.student_id);
+        END''',
+    ):
+        conn.execute(sql)
+    conn.execute("INSERT INTO students_fts(students_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO attendance_fts(attendance_fts) VALUES ('rebuild')")
+
+
+def m004_attendance_daily(conn):
+    """Per-student, per-day attendance counts kept up to date by triggers"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_daily (
+        student_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (student_id, day)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_daily_day ON attendance_daily(day, count)")
+    # day is the local date from the TEXT timestamp; rows missing a student
+    # or timestamp are counted under 0 / '' so the totals still add up
+    increment = '''
+        INSERT INTO attendance_daily (student_id, day, count)
+        VALUES (COALESCE(NEW.student_id, 0), COALESCE(substr(NEW.timestamp, 1, 10), ''), 1)
+        ON CONFLICT (student_id, day) DO UPDATE SET count = count + 1;'''
+    decrement = '''
+        UPDATE attendance_daily SET count = count - 1
+        WHERE student_id = COALESCE(OLD.student_id, 0) AND day = COALESCE(substr(OLD.timestamp, 1, 10), '');
+        DELETE FROM attendance_daily
+        WHERE student_id = COALESCE(OLD.student_id, 0) AND day = COALESCE(substr(OLD.timestamp, 1, 10), '')
+          AND count <= 0;'''
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS attendance_daily_insert AFTER INSERT ON attendance BEGIN {increment} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS attendance_daily_delete AFTER DELETE ON attendance BEGIN {decrement} END")
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS attendance_daily_update
+        AFTER UPDATE OF student_id, timestamp ON attendance BEGIN {decrement} {increment} END''')
+    # One pass inside this transaction, so a re-run after an interruption
+    # can't count rows twice
+    conn.execute("DELETE FROM attendance_daily")
+    conn.execute('''
+        INSERT INTO attendance_daily (student_id, day, count)
+        SELECT COALESCE(student_id, 0), COALESCE(substr(timestamp, 1, 10), ''), COUNT(*)
+        FROM attendance GROUP BY 1, 2
+    ''')
+
+
+def m005_data_version(conn):
+    """Change counter for cache invalidation across processes (see cache.py)"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+    bump = "UPDATE data_version SET version = version + 1 WHERE id = 1;"
+    for table, columns in (("attendance", "student_id, name, timestamp, status"),
+                           ("students", "id, user_id, name, email, phone")):
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table} BEGIN {bump} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_version_delete AFTER DELETE ON {table} BEGIN {bump} END")
+        # Only columns the cached responses show (attendance_fill_ts updates ts)
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE OF {columns} ON {table} "
+                     f"BEGIN {bump} END")
+
+
+def m006_attendance_periods(conn, period_seconds=DEFAULT_PERIOD_SECONDS):
+    """One row per student per period; repeat sightings update last_seen"""
+    add_column(conn, "attendance", "period", "INTEGER")
+    add_column(conn, "attendance", "last_seen", "INTEGER")
+    add_column(conn, "attendance", "seen_count", "INTEGER NOT NULL DEFAULT 1")
+    # strftime('%s') of the local TEXT timestamp is the local wall clock as
+    # seconds, so periods line up with local hours (same as period_start())
+    backfill(conn, f'''
+        UPDATE attendance
+        SET period = ts - CAST(strftime('%s', timestamp) AS INTEGER) % {int(period_seconds)}, last_seen = ts
+        WHERE id > :lo AND id <= :hi AND period IS NULL AND ts IS NOT NULL
+    ''')
+    # Keep the first row of every (student, period) and fold the rest into it
+    conn.execute('''
+        CREATE TEMP TABLE period_dups AS
+        SELECT student_id, period, MIN(id) AS keep_id, MAX(last_seen) AS last_seen, SUM(seen_count) AS seen_count
+        FROM attendance WHERE student_id IS NOT NULL AND period IS NOT NULL
+        GROUP BY student_id, period HAVING COUNT(*) > 1
+    ''')
+    conn.execute('''
+        UPDATE attendance
+        SET last_seen = (SELECT last_seen FROM period_dups WHERE keep_id = attendance.id),
+            seen_count = (SELECT seen_count FROM period_dups WHERE keep_id = attendance.id)
+        WHERE id IN (SELECT keep_id FROM period_dups)
+    ''')
+    conn.execute('''
+        DELETE FROM attendance WHERE id IN (
+            SELECT a.id FROM attendance a
+            JOIN period_dups d ON a.student_id = d.student_id AND a.period = d.period
+            WHERE a.id <> d.keep_id)
+    ''')
+    conn.execute("DROP TABLE period_dups")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_student_period ON attendance(student_id, period)")
+
+
+def m007_dataset_images(conn):
+    """Manifest of dataset/ sample images (filled by dataset_manifest.py)"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS dataset_images (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT UNIQUE NOT NULL,
+        student_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        sample_index INTEGER,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        hash TEXT NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dataset_images_student ON dataset_images(student_id, sample_index)")
+
+
+def m008_settings(conn):
+    """Settings shared by every process; the period window starts at the one m006 backfilled with"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+                 (PERIOD_SETTING, str(DEFAULT_PERIOD_SECONDS)))
+
+
+MIGRATIONS = [
+    (1, m001_baseline),
+    (2, m002_attendance_indexes),
+    (3, m003_search_index),
+    (4, m004_attendance_daily),
+    (5, m005_data_version),
+    (6, m006_attendance_periods),
+    (7, m007_dataset_images),
+    (8, m008_settings),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, verbose=False):
+    """Bring the schema up to LATEST_VERSION; returns the versions applied"""
+    if conn.in_transaction:
+        conn.commit()
+    applied = []
+    for version, fn in MIGRATIONS:
+        if current_version(conn) >= version:
+            continue
+        started = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have applied it while we waited for the lock
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            fn(conn)
+            conn.execute(f"PRAGMA user_version={version}")
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"Applied migration {version} ({fn.__name__}) in {time.time() - started:.2f}s")
+    return applied
+
+
+def epoch(timestamp):
+    """Epoch seconds for a local 'YYYY-MM-DD HH:MM:SS' timestamp"""
+    return int(time.mktime(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S")))
+
+
+def period_start(ts, period_seconds=DEFAULT_PERIOD_SECONDS):
+    """Epoch start of the local-time period containing epoch ts"""
+    ts = int(ts)
+    return ts - calendar.timegm(time.localtime(ts)) % int(period_seconds)
+
+
+def get_period_seconds(conn):
+    """The attendance period window every writer must use"""
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (PERIOD_SETTING,)).fetchone()
+    return int(row[0]) if row else DEFAULT_PERIOD_SECONDS
+
+
+def load_period_seconds(db_path=DB):
+    """get_period_seconds() on a short-lived connection to an up-to-date db_path"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        migrate(conn)
+        return get_period_seconds(conn)
+    finally:
+        conn.close()
+
+
+def set_period_seconds(conn, seconds):
+    """Change the period window for new sightings; existing rows keep their
+    periods. Running recognizers and app workers use it once restarted."""
+    seconds = int(seconds)
+    # Must divide a day, so periods start at the same times every day
+    if seconds < 60 or 86400 % seconds:
+        raise ValueError(f"A period of {seconds} seconds does not divide a day.")
+    conn.execute("INSERT INTO settings (key, value) VALUES (?, ?) "
+                 "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (PERIOD_SETTING, str(seconds)))
+    conn.commit()
+
+
+UPSERT_ATTENDANCE = '''
+    INSERT INTO attendance (student_id, name, timestamp, ts, period, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (student_id, period) DO UPDATE SET
+        last_seen = MAX(COALESCE(last_seen, ts), excluded.last_seen),
+        seen_count = seen_count + 1
+'''
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate the attendance database schema")
+    parser.add_argument("--db", default=DB)
+    parser.add_argument("--status", action="store_true", help="only print the schema version")
+    parser.add_argument("--period-minutes", type=int,
+                        help="set the attendance period: a student is marked at most once per period")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    if args.status:
+        print(f"Schema version {current_version(conn)} (latest {LATEST_VERSION})")
+    else:
+        applied = migrate(conn, verbose=True)
+        print(f"Schema at version {current_version(conn)}." + ("" if applied else " Nothing to do."))
+        if args.period_minutes is not None:
+            try:
+                set_period_seconds(conn, args.period_minutes * 60)
+            except ValueError as e:
+                print(e)
+                raise SystemExit(1)
+        print(f"Attendance period: {get_period_seconds(conn) // 60} minutes.")
+    conn.close()
@@ -0,0 +1,335 @@
+"""Compact binary storage for the LBPH face model.
+
+trainer.yml stores every LBP histogram as YAML text, which OpenCV is slow to
+write and parse. The binary format keeps the same data as raw arrays:
+
+    magic b"LBPHBIN\\0" | uint32 version | uint32 header size | JSON header
+    | padding to 64 bytes | int32 labels[count] | float32 histograms[count, dim]
+
+Loading only parses the small header and memory-maps the arrays, so it takes
+milliseconds and several recognizer processes share one copy through the OS
+page cache instead of each keeping its own parsed model. cv2.face has no
+way to hand it those arrays, so LBPHModel.predict() does what cv2's does:
+the same LBP histogram, compared to every sample with cv2.compareHist.
+
+Large models also get an IVF index (ann_index.py) in trainer.lbph.ivf, so
+predict() only re-ranks the samples of the nprobe nearest partitions
+instead of scanning them all.
+"""
+import json
+import math
+import os
+import struct
+import sys
+import uuid
+
+import cv2
+import numpy as np
+
+import ann_index
+
+MAGIC = b"LBPHBIN\0"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+BINARY_MODEL_PATH = "trainer/trainer.lbph"
+YAML_MODEL_PATH = "trainer/trainer.yml"
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def elbp(src, radius=1, neighbors=8):
+    """Extended (circular) LBP codes, same arithmetic as OpenCV's LBPH"""
+    src = np.asarray(src)
+    rows, cols = src.shape
+    dst = np.zeros((rows - 2 * radius, cols - 2 * radius), dtype=np.int32)
+    center = src[radius:rows - radius, radius:cols - radius].astype(np.float32)
+
+    def shifted(dy, dx):
+        return src[radius + dy:rows - radius + dy, radius + dx:cols - radius + dx].astype(np.float32)
+
+    eps = np.finfo(np.float32).eps
+    for n in range(neighbors):
+        x = np.float32(radius * math.cos(2.0 * math.pi * n / neighbors))
+        y = np.float32(-radius * math.sin(2.0 * math.pi * n / neighbors))
+        fx, fy = int(math.floor(x)), int(math.floor(y))
+        cx, cy = int(math.ceil(x)), int(math.ceil(y))
+        ty = np.float32(y - fy)
+        tx = np.float32(x - fx)
+        one = np.float32(1)
+        w1 = (one - tx) * (one - ty)
+        w2 = tx * (one - ty)
+        w3 = (one - tx) * ty
+        w4 = tx * ty
+        t = w1 * shifted(fy, fx) + w2 * shifted(fy, cx) + w3 * shifted(cy, fx) + w4 * shifted(cy, cx)
+        dst += (((t > center) | (np.abs(t - center) < eps)).astype(np.int32) << n)
+    return dst
+
+
+def spatial_histogram(codes, num_patterns, grid_x=8, grid_y=8):
+    """Concatenated, per-cell normalized histograms of LBP codes"""
+    width = codes.shape[1] // grid_x
+    height = codes.shape[0] // grid_y
+    result = np.zeros((grid_x * grid_y, num_patterns), dtype=np.float32)
+    if width == 0 or height == 0:
+        return result.reshape(1, -1)
+    cell = 0
+    for i in range(grid_y):
+        for j in range(grid_x):
+            block = codes[i * height:(i + 1) * height, j * width:(j + 1) * width]
+            hist = np.bincount(block.ravel(), minlength=num_patterns)[:num_patterns]
+            result[cell] = hist.astype(np.float32) / np.float32(block.size)
+            cell += 1
+    return result.reshape(1, -1)
+
+
+def chi_square(query, histograms):
+    """OpenCV HISTCMP_CHISQR_ALT distance from one histogram to many"""
+    # cv2.compareHist per row is the kernel LBPHFaceRecognizer.predict runs:
+    # same distances and speed as cv2, and no temporaries, since each
+    # (memory-mapped) row is read in place
+    query = np.asarray(query, dtype=np.float32).ravel()
+    return np.array([cv2.compareHist(row, query, cv2.HISTCMP_CHISQR_ALT)
+                     for row in np.asarray(histograms)], dtype=np.float64)
+
+
+class LBPHModel:
+    """LBPH histograms + labels with a predict() compatible with cv2.face"""
+
+    def __init__(self, histograms, labels, radius=1, neighbors=8, grid_x=8, grid_y=8,
+                 threshold=sys.float_info.max, index=None, model_id=None):
+        self.histograms = histograms
+        self.labels = labels
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.threshold = threshold
+        self.index = index
+        # Set by save_model()/load_model(); ties the .ivf file to this model file
+        self.model_id = model_id
+        # Partitions searched per predict(); 0 scans every sample
+        self.nprobe = ann_index.DEFAULT_NPROBE
+
+    def __len__(self):
+        return len(self.labels)
+
+    def histogram(self, gray):
+        codes = elbp(gray, self.radius, self.neighbors)
+        return spatial_histogram(codes, 2 ** self.neighbors, self.grid_x, self.grid_y)
+
+    def predict(self, gray):
+        """Return (label, distance) like LBPHFaceRecognizer.predict"""
+        if len(self.labels) == 0:
+            return -1, sys.float_info.max
+        query = self.histogram(gray)
+        if self.index is not None and self.nprobe > 0:
+            # Exact chi-square re-rank of the probed partitions only
+            rows = self.index.probe(coarse_features(query), self.nprobe)
+            dist = chi_square(query, self.histograms[rows])
+            best = int(np.argmin(dist))
+            best_row = int(rows[best])
+        else:
+            dist = chi_square(query, self.histograms)
+            best = best_row = int(np.argmin(dist))
+        if dist[best] >= self.threshold:
+            return -1, float(dist[best])
+        return int(self.labels[best_row]), float(dist[best])
+
+    def build_index(self, nlist=None):
+        """Cluster the samples into an IVF index used by predict()"""
+        self.index = ann_index.IVFIndex.build(self.histograms, nlist, transform=coarse_features)
+        return self.index
+
+    def params(self):
+        return {
+            "radius": self.radius,
+            "neighbors": self.neighbors,
+            "grid_x": self.grid_x,
+            "grid_y": self.grid_y,
+            "threshold": self.threshold,
+        }
+
+    def appended(self, histograms, labels):
+        """New in-memory model with extra samples (what LBPH update() does)"""
+        index = self.index.added(coarse_features(histograms)) if self.index is not None else None
+        return LBPHModel(
+            np.vstack([np.asarray(self.histograms), histograms]).astype(np.float32),
+            np.concatenate([np.asarray(self.labels), labels]).astype(np.int32),
+            index=index, **self.params())
+
+    def without(self, labels):
+        """New in-memory model with every sample of these labels removed"""
+        keep = ~np.isin(np.asarray(self.labels), list(labels))
+        index = self.index.removed(keep) if self.index is not None else None
+        return LBPHModel(
+            np.asarray(self.histograms)[keep].astype(np.float32),
+            np.asarray(self.labels)[keep].astype(np.int32),
+            index=index, **self.params())
+
+
+def coarse_features(histograms):
+    # L2 between square-rooted histograms (Hellinger) tracks chi-square,
+    # so the index can cluster with plain k-means
+    return np.sqrt(np.maximum(np.asarray(histograms, dtype=np.float32), 0)).reshape(len(histograms), -1)
+
+
+def from_recognizer(recognizer):
+    """Copy histograms and labels out of a cv2.face LBPHFaceRecognizer"""
+    hists = recognizer.getHistograms()
+    if hists:
+        histograms = np.vstack([np.asarray(h, dtype=np.float32).reshape(1, -1) for h in hists])
+    else:
+        histograms = np.zeros((0, 0), dtype=np.float32)
+    labels = np.asarray(recognizer.getLabels(), dtype=np.int32).ravel()
+    threshold = recognizer.getThreshold()
+    return LBPHModel(histograms, labels, recognizer.getRadius(), recognizer.getNeighbors(),
+                     recognizer.getGridX(), recognizer.getGridY(),
+                     threshold if math.isfinite(threshold) else sys.float_info.max)
+
+
+def save_model(model, path=BINARY_MODEL_PATH):
+    """Write the binary model atomically (temp file + rename), plus its index.
+
+    Every save gets a new model_id, stored in the header and in the index,
+    so a reader never pairs the model with an index from another save.
+    """
+    model.model_id = uuid.uuid4().hex
+    histograms = np.ascontiguousarray(model.histograms, dtype="<f4")
+    labels = np.ascontiguousarray(model.labels, dtype="<i4").ravel()
+    count = len(labels)
+    dim = histograms.shape[1] if count else 0
+
+    header = dict(model.params(), count=count, dim=dim, model_id=model.model_id)
+    prefix = len(MAGIC) + 8
+    header_bytes = json.dumps(header).encode("utf-8")
+    labels_offset = _align(prefix + len(header_bytes))
+    histograms_offset = _align(labels_offset + labels.nbytes)
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # Index first: until the model is replaced too, readers see a mismatched
+    # model_id and scan every sample instead of using a stale index
+    if model.index is not None:
+        ann_index.save_index(model.index, ann_index.index_path(path), model.model_id)
+    elif os.path.exists(ann_index.index_path(path)):
+        os.remove(ann_index.index_path(path))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<II", FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (labels_offset - f.tell()))
+        f.write(labels.tobytes())
+        f.write(b"\0" * (histograms_offset - f.tell()))
+        f.write(histograms.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_model(path=BINARY_MODEL_PATH):
+    """Memory-map a binary model written by save_model()"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a binary LBPH model")
+        version, header_size = struct.unpack("<II", f.read(8))
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported model format version {version}")
+        header = json.loads(f.read(header_size).decode("utf-8"))
+
+    count, dim = header["count"], header["dim"]
+    labels_offset = _align(len(MAGIC) + 8 + header_size)
+    histograms_offset = _align(labels_offset + 4 * count)
+    if count:
+        labels = np.memmap(path, dtype="<i4", mode="r", offset=labels_offset, shape=(count,))
+        histograms = np.memmap(path, dtype="<f4", mode="r", offset=histograms_offset, shape=(count, dim))
+    else:
+        labels = np.zeros(0, dtype=np.int32)
+        histograms = np.zeros((0, dim), dtype=np.float32)
+    model_id = header.get("model_id")
+    index = ann_index.load_index(ann_index.index_path(path), model_id)
+    if index is not None and len(index) != count:
+        # Corrupt or hand-copied; predict() falls back to a full scan
+        index = None
+    return LBPHModel(histograms, labels, header["radius"], header["neighbors"],
+                     header["grid_x"], header["grid_y"], header["threshold"], index, model_id)
+
+
+def load_yaml(path=YAML_MODEL_PATH):
+    """Parse an OpenCV trainer.yml into an LBPHModel (slow; for conversion)"""
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(path)
+    return from_recognizer(recognizer)
+
+
+def export_yaml(model, path=YAML_MODEL_PATH):
+    """Write the model in OpenCV's trainer.yml layout"""
+    tmp_path = path + ".tmp.yml"
+    fs = cv2.FileStorage(tmp_path, cv2.FILE_STORAGE_WRITE)
+    fs.startWriteStruct("opencv_lbphfaces", cv2.FileNode_MAP)
+    fs.write("threshold", float(model.threshold))
+    fs.write("radius", int(model.radius))
+    fs.write("neighbors", int(model.neighbors))
+    fs.write("grid_x", int(model.grid_x))
+    fs.write("grid_y", int(model.grid_y))
+    fs.startWriteStruct("histograms", cv2.FileNode_SEQ)
+    for row in np.asarray(model.histograms, dtype=np.float32):
+        fs.write("", row.reshape(1, -1))
+    fs.endWriteStruct()
+    fs.write("labels", np.asarray(model.labels, dtype=np.int32).reshape(-1, 1))
+    fs.startWriteStruct("labelsInfo", cv2.FileNode_SEQ)
+    fs.endWriteStruct()
+    fs.endWriteStruct()
+    fs.release()
+    os.replace(tmp_path, path)
+
+
+def load_recognizer(binary_path=BINARY_MODEL_PATH, yaml_path=YAML_MODEL_PATH):
+    """Load whichever model exists, preferring the fast binary format"""
+    if os.path.exists(binary_path):
+        return load_model(binary_path)
+    if os.path.exists(yaml_path):
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(yaml_path)
+        return recognizer
+    return None
+
+
+def model_exists(binary_path=BINARY_MODEL_PATH, yaml_path=YAML_MODEL_PATH):
+    return os.path.exists(binary_path) or os.path.exists(yaml_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert between trainer.yml and the binary model, or index it")
+    sub = parser.add_subparsers(dest="command", required=True)
+    to_bin = sub.add_parser("import-yaml", help="convert trainer.yml to the binary format")
+    to_bin.add_argument("src", nargs="?", default=YAML_MODEL_PATH)
+    to_bin.add_argument("dst", nargs="?", default=BINARY_MODEL_PATH)
+    to_yaml = sub.add_parser("export-yaml", help="write the binary model as trainer.yml")
+    to_yaml.add_argument("src", nargs="?", default=BINARY_MODEL_PATH)
+    to_yaml.add_argument("dst", nargs="?", default=YAML_MODEL_PATH)
+    build = sub.add_parser("build-index", help="cluster the binary model's samples into an IVF index")
+    build.add_argument("path", nargs="?", default=BINARY_MODEL_PATH)
+    build.add_argument("--nlist", type=int, help="partitions (default: sqrt of the sample count)")
+    args = parser.parse_args()
+
+    if args.command == "build-index":
+        model = load_model(args.path)
+        model.build_index(args.nlist)
+        ann_index.save_index(model.index, ann_index.index_path(args.path), model.model_id)
+        sizes = model.index.list_sizes()
+        print(f"Indexed {len(model)} samples in {model.index.nlist} partitions "
+              f"(largest {sizes.max()}) at {ann_index.index_path(args.path)}")
+        sys.exit(0)
+    if args.command == "import-yaml":
+        model = load_yaml(args.src)
+        save_model(model, args.dst)
+    else:
+        model = load_model(args.src)
+        export_yaml(model, args.dst)
+    print(f"Wrote {len(model)} samples to {args.dst}")
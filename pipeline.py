@@ -0,0 +1,110 @@
+"""Small threaded stage pipeline used by recognize_cv.py.
+
+Each Stage is a thread that takes items from an input queue, applies a
+function and puts the result on its output queue. Queues are bounded, so a
+slow stage applies back-pressure instead of letting work pile up; queues
+created with drop_oldest=True (the capture side) discard the oldest item
+instead, which keeps end-to-end latency bounded when the pipeline falls
+behind the camera.
+"""
+import queue
+import threading
+import time
+
+
+class StageQueue(queue.Queue):
+    """Bounded queue that can drop its oldest item instead of blocking"""
+
+    def __init__(self, maxsize, drop_oldest=False):
+        super().__init__(maxsize)
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+
+    def put_item(self, item, stop_event):
+        if self.drop_oldest:
+            while True:
+                try:
+                    self.put_nowait(item)
+                    return True
+                except queue.Full:
+                    try:
+                        self.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+        while not stop_event.is_set():
+            try:
+                self.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class Stage(threading.Thread):
+    """Run fn over items from in_queue; fn may return None to emit nothing.
+
+    A stage without an in_queue is a source: fn() is called repeatedly and
+    the stage stops when it returns StopIteration.
+    """
+
+    def __init__(self, name, fn, in_queue=None, out_queue=None, stop_event=None):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.stop_event = stop_event or threading.Event()
+        self.processed = 0
+        self.busy_time = 0.0
+        self.error = None
+        self._last_processed = 0
+        self._last_report = time.time()
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                if self.in_queue is None:
+                    started = time.perf_counter()
+                    result = self.fn()
+                else:
+                    try:
+                        item = self.in_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    started = time.perf_counter()
+                    result = self.fn(item)
+                self.busy_time += time.perf_counter() - started
+                if result is StopIteration:
+                    break
+                self.processed += 1
+                if result is not None and self.out_queue is not None:
+                    self.out_queue.put_item(result, self.stop_event)
+        except Exception as e:
+            self.error = e
+            print(f"[{self.name}] stage failed: {e}")
+        finally:
+            self.stop_event.set()
+
+    def stats(self):
+        """Throughput since the previous call, plus input queue depth/drops"""
+        now = time.time()
+        elapsed = max(now - self._last_report, 1e-6)
+        fps = (self.processed - self._last_processed) / elapsed
+        self._last_processed = self.processed
+        self._last_report = now
+        inq = self.in_queue
+        return {
+            "stage": self.name,
+            "fps": round(fps, 1),
+            "processed": self.processed,
+            "busy": round(self.busy_time, 3),
+            "queue": inq.qsize() if inq is not None else 0,
+            "dropped": inq.dropped if inq is not None else 0,
+        }
+
+
+def format_stats(stages):
+    return " | ".join(
+        f"{s['stage']}: {s['fps']:.1f}/s q={s['queue']} drop={s['dropped']}"
+        for s in (stage.stats() for stage in stages)
+    )
@@ -1,7 +1,7 @@
 # populate_students.py
 import sqlite3
 import os
-import pickle
+import dataset_manifest
 
 DB = 'attendance.db'
 dataset_dir = 'dataset'
@@ -10,17 +10,8 @@ if not os.path.exists(dataset_dir):
     print("dataset/ not found. Nothing to populate.")
     exit()
 
-# build map id -> name from filenames like name.id.count.jpg
-mapping = {}
-for f in os.listdir(dataset_dir):
-    parts = f.split('.')
-    if len(parts) >= 3:
-        name = parts[0]
-        try:
-            sid = int(parts[1])
-        except:
-            continue
-        mapping[sid] = name
+# map id -> name from the dataset manifest (filenames like name.id.count.jpg)
+mapping = dataset_manifest.load_id_name_map(DB)
 
 if not mapping:
     print("No valid dataset files found.")
@@ -29,14 +20,13 @@ if not mapping:
 conn = sqlite3.connect(DB)
 c = conn.cursor()
 
-# For each id, insert if not exists. We'll store a small placeholder encoding (empty bytes pickled).
+# For each id, insert if not exists. The encoding stays empty until train.py --backend embedding fills it.
 for sid, name in mapping.items():
     c.execute("SELECT id FROM students WHERE id=?", (sid,))
     if c.fetchone():
         print(f"Already in DB: {sid} -> {name}")
         continue
-    placeholder = pickle.dumps(b'')  # placeholder encoding blob
-    c.execute("INSERT INTO students (id, name, encoding) VALUES (?, ?, ?)", (sid, name, placeholder))
+    c.execute("INSERT INTO students (id, name, encoding) VALUES (?, ?, ?)", (sid, name, b''))
     print(f"Inserted: {sid} -> {name}")
 
 conn.commit()
@@ -1,76 +1,396 @@
 import cv2
-import sqlite3
-from datetime import datetime
 import os
 import numpy as np
+import argparse
+import json
+from datetime import datetime
+import queue
+import threading
+import time
+import model_store
+import embeddings
+import ann_index
+import dataset_manifest
+import migrations
+from pipeline import Stage, StageQueue, format_stats
+from tracking import FaceTracker
+from attendance_writer import AttendanceWriter, PeriodCache
+
+DB = migrations.DB
+CONFIDENCE_THRESHOLD = 80
+WINDOW_NAME = "Attendance - press q to quit"
+
+def mark_attendance(writer, student_id, name):
+    """Queue the row on the background writer; nothing blocks on SQLite here.
+
+    Students already marked this period are skipped by the writer's cache.
+    """
+    timestamp = writer.mark(student_id, name)
+    if timestamp is not None:
+        print(f"Marked {name} at {timestamp}")
+
+def load_id_name_map(db_path=None, dataset_dir=dataset_manifest.DATASET_DIR):
+    """id -> name from the dataset manifest (see dataset_manifest.py)"""
+    return dataset_manifest.load_id_name_map(db_path or DB, dataset_dir)
+
+def create_face_cascade():
+    return cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+def detect_faces(face_cascade, gray):
+    return face_cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5)
+
+def identify(recognizer, id_name, roi):
+    """Return (student_id or None, name, label) for one face crop"""
+    sid, confidence = recognizer.predict(roi)
+    return label_prediction(id_name, sid, confidence, recognizer_threshold(recognizer))
+
+def recognizer_threshold(recognizer):
+    # The embedding backend scores distance * 100 and has its own cut-off
+    return getattr(recognizer, "confidence_threshold", CONFIDENCE_THRESHOLD)
+
+def label_prediction(id_name, sid, confidence, threshold=CONFIDENCE_THRESHOLD):
+    if confidence < threshold:
+        name = id_name.get(sid, f"ID{sid}")
+        return sid, name, f"{name} ({int(confidence)})"
+    return None, None, "Unknown"
 
-DB = 'attendance.db'
-
-def mark_attendance(student_id, name):
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("INSERT INTO attendance (student_id, name, timestamp) VALUES (?, ?, ?)",
-              (student_id, name, timestamp))
-    conn.commit()
-    conn.close()
-    print(f"Marked {name} at {timestamp}")
-
-def load_id_name_map():
-    mapping = {}
-    if not os.path.exists('dataset'):
-        return mapping
-    for f in os.listdir('dataset'):
-        parts = f.split(".")
-        if len(parts) >= 3:
-            name = parts[0]
-            sid = int(parts[1])
-            mapping[sid] = name
-    return mapping
-
-if not os.path.exists('trainer/trainer.yml'):
-    print("Model not found. Run train.py first.")
-    exit()
-
-recognizer = cv2.face.LBPHFaceRecognizer_create()
-recognizer.read('trainer/trainer.yml')
-
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-id_name = load_id_name_map()
-recognized_set = set()
-
-cam = cv2.VideoCapture(0)
-print("Running recognizer. Press 'q' to quit.")
-
-while True:
-    ret, frame = cam.read()
-    if not ret:
-        print("No camera input")
-        break
-
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5)
-
-    for (x, y, w, h) in faces:
-        roi = gray[y:y+h, x:x+w]
-        sid, confidence = recognizer.predict(roi)
-
-        if confidence < 80:
-            name = id_name.get(sid, f"ID{sid}")
-            if sid not in recognized_set:
-                mark_attendance(sid, name)
-                recognized_set.add(sid)
-            label = f"{name} ({int(confidence)})"
+def draw_label(frame, box, label):
+    (x, y, w, h) = box
+    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+
+class FrameProcessor:
+    """Detection + recognition for one frame, with or without tracking.
+
+    detect() and recognize() are separate so the pipeline can run them on
+    different threads; process() runs both. detect() returns boxes, or
+    (box, identity, votes) snapshots of the tracks when tracking;
+    recognize() and process() return a list of (box, student_id or None,
+    name, label). Time spent detecting and predicting is accumulated
+    separately for reports.
+    """
+
+    def __init__(self, recognizer, face_cascade, id_name, tracker=None):
+        self.recognizer = recognizer
+        self.face_cascade = face_cascade
+        self.id_name = id_name
+        self.tracker = tracker
+        self.threshold = recognizer_threshold(recognizer)
+        self.detect_seconds = 0.0
+        self.predict_seconds = 0.0
+        self.predictions = 0
+
+    def predict(self, roi):
+        started = time.perf_counter()
+        result = self.recognizer.predict(roi)
+        self.predict_seconds += time.perf_counter() - started
+        self.predictions += 1
+        return result
+
+    def predict_id(self, roi):
+        sid, confidence = self.predict(roi)
+        return sid if confidence < self.threshold else None
+
+    def predict_boxes(self, gray, boxes):
+        """(sid, confidence) per box; one batched call if the backend has predict_many"""
+        if not hasattr(self.recognizer, "predict_many"):
+            return [self.predict(gray[y:y+h, x:x+w]) for (x, y, w, h) in boxes]
+        started = time.perf_counter()
+        results = self.recognizer.predict_many(gray, boxes)
+        self.predict_seconds += time.perf_counter() - started
+        self.predictions += len(results)
+        return results
+
+    def detect(self, gray):
+        started = time.perf_counter()
+        predict_before = self.predict_seconds
+        if self.tracker is not None:
+            # Tracks carry their own votes, so prediction happens here too.
+            # The tracker keeps mutating its tracks on later frames, so hand
+            # recognize() a copy that stays consistent with this frame
+            detected = [(tuple(track.box), track.identity(), list(track.votes))
+                        for track in self.tracker.update(gray, self.predict_id)]
         else:
-            label = "Unknown"
+            detected = detect_faces(self.face_cascade, gray)
+        self.detect_seconds += time.perf_counter() - started - (self.predict_seconds - predict_before)
+        return detected
+
+    def recognize(self, gray, detected):
+        results = []
+        if self.tracker is not None:
+            for box, sid, votes in detected:
+                if sid is None:
+                    results.append((box, None, None, "Unknown"))
+                    continue
+                name = self.id_name.get(sid, f"ID{sid}")
+                agree = sum(1 for v in votes if v == sid)
+                results.append((box, sid, name, f"{name} [{agree}/{len(votes)}]"))
+            return results
+        for (x, y, w, h), (sid, confidence) in zip(detected, self.predict_boxes(gray, detected)):
+            sid, name, label = label_prediction(self.id_name, sid, confidence, self.threshold)
+            results.append(((x, y, w, h), sid, name, label))
+        return results
+
+    def process(self, gray):
+        return self.recognize(gray, self.detect(gray))
+
+    def describe(self, gray):
+        """Detected faces as dicts with box, student_id, name and confidence"""
+        faces = []
+        detected = detect_faces(self.face_cascade, gray)
+        for (x, y, w, h), (sid, confidence) in zip(detected, self.predict_boxes(gray, detected)):
+            known = confidence < self.threshold
+            faces.append({
+                "box": [int(x), int(y), int(w), int(h)],
+                "student_id": int(sid) if known else None,
+                "name": self.id_name.get(sid, f"ID{sid}") if known else None,
+                "confidence": round(float(confidence), 2),
+            })
+        return faces
 
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+def run_serial(cam, processor, writer):
+    """Original single-threaded loop: every stage runs inline per frame"""
+    while True:
+        ret, frame = cam.read()
+        if not ret:
+            print("No camera input")
+            break
 
-    cv2.imshow("Attendance - press q to quit", frame)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+        for box, sid, name, label in processor.process(gray):
+            if sid is not None:
+                mark_attendance(writer, sid, name)
+            draw_label(frame, box, label)
+
+        cv2.imshow(WINDOW_NAME, frame)
+
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+def run_pipeline(cam, processor, writer, queue_size=4, stats_interval=5.0):
+    """Capture -> detect -> recognize -> write stages on separate threads.
+
+    Capture drops the oldest frame when detection falls behind, so what is
+    shown and recognized is never more than queue_size frames old. The
+    write stage is the AttendanceWriter thread. The display runs on the main
+    thread because HighGUI requires it.
+    """
+    stop = threading.Event()
+    captured = StageQueue(queue_size, drop_oldest=True)
+    detected = StageQueue(queue_size)
+    display = StageQueue(queue_size, drop_oldest=True)
+
+    def capture():
+        ret, frame = cam.read()
+        if not ret:
+            print("No camera input")
+            return StopIteration
+        return frame
+
+    def detect(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame, gray, processor.detect(gray)
+
+    def recognize(item):
+        frame, gray, faces = item
+        labels = []
+        for box, sid, name, label in processor.recognize(gray, faces):
+            if sid is not None:
+                mark_attendance(writer, sid, name)
+            labels.append((box, label))
+        return frame, labels
+
+    stages = [
+        Stage("capture", capture, out_queue=captured, stop_event=stop),
+        Stage("detect", detect, captured, detected, stop),
+        Stage("recognize", recognize, detected, display, stop),
+    ]
+    for stage in stages:
+        stage.start()
+
+    last_report = time.time()
+    try:
+        while not stop.is_set():
+            try:
+                frame, labels = display.get(timeout=0.1)
+            except queue.Empty:
+                frame = None
+            if frame is not None:
+                for box, label in labels:
+                    draw_label(frame, box, label)
+                cv2.imshow(WINDOW_NAME, frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+            if stats_interval and time.time() - last_report >= stats_interval:
+                w = writer.stats()
+                print(format_stats(stages) + f" | write: {w['written']} rows in {w['flushes']} txns "
+                      f"q={w['pending']} skipped={w['skipped']}")
+                last_report = time.time()
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join(timeout=2)
+
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".bmp")
+
+def iter_frames(source):
+    """Yield every frame of a video file, or every image in a directory"""
+    if os.path.isdir(source):
+        for f in sorted(os.listdir(source)):
+            if f.lower().endswith(IMAGE_EXT):
+                frame = cv2.imread(os.path.join(source, f))
+                if frame is not None:
+                    yield frame
+        return
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"Could not open {source}")
+        return
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def run_headless(sources, processor, writer=None, period_seconds=migrations.DEFAULT_PERIOD_SECONDS):
+    """Process every frame of the sources as fast as possible, no display.
+
+    With writer=None (dry run) attendance events are only collected.
+    Returns a report with fps, detect/predict time split and the events.
+    """
+    periods = PeriodCache(period_seconds) if writer is None else None
+    events = []
+    frames = 0
+    started = time.perf_counter()
+    for source in sources:
+        for frame_no, frame in enumerate(iter_frames(source)):
+            frames += 1
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            for box, sid, name, label in processor.process(gray):
+                if sid is None:
+                    continue
+                if writer is not None:
+                    timestamp = writer.mark(sid, name)
+                elif periods.claim(sid, time.time()) is not None:
+                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                else:
+                    timestamp = None
+                if timestamp is None:
+                    continue
+                events.append({"student_id": int(sid), "name": name, "timestamp": timestamp,
+                               "source": source, "frame": frame_no})
+    elapsed = time.perf_counter() - started
+    return {
+        "frames": frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "detect_seconds": round(processor.detect_seconds, 3),
+        "predict_seconds": round(processor.predict_seconds, 3),
+        "other_seconds": round(elapsed - processor.detect_seconds - processor.predict_seconds, 3),
+        "predictions": processor.predictions,
+        "dry_run": writer is None,
+        "events": events,
+    }
+
+def print_report(report):
+    print(f"Frames: {report['frames']} in {report['seconds']}s ({report['fps']} fps)")
+    print(f"Detect: {report['detect_seconds']}s  Predict: {report['predict_seconds']}s "
+          f"({report['predictions']} calls)  Other: {report['other_seconds']}s")
+    verb = "Would mark" if report["dry_run"] else "Marked"
+    for e in report["events"]:
+        print(f"{verb} {e['name']} (ID {e['student_id']}) from {e['source']} frame {e['frame']}")
+    print(f"{len(report['events'])} attendance events.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recognize faces from a camera and mark attendance")
+    parser.add_argument("sources", nargs="*",
+                        help="video files or image directories to process headless instead of the camera")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="with sources, report attendance events without writing to the DB")
+    parser.add_argument("--report-json", help="with sources, also write the report to this JSON file")
+    parser.add_argument("--camera", type=int, default=0, help="camera index for cv2.VideoCapture")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="run capture/detect/recognize/write as separate threaded stages")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="max frames buffered between pipeline stages")
+    parser.add_argument("--stats-interval", type=float, default=5.0,
+                        help="seconds between pipeline stage reports (0 = off)")
+    parser.add_argument("--track", action="store_true",
+                        help="follow faces between frames instead of detecting/predicting every frame")
+    parser.add_argument("--detect-every", type=int, default=10,
+                        help="with --track, frames between full-frame detections")
+    parser.add_argument("--vote-k", type=int, default=5,
+                        help="with --track, predictions voted over per face")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="attendance rows per write transaction")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="max seconds a recognized student waits before being written")
+    parser.add_argument("--backend", choices=["lbph", "embedding"], default="lbph",
+                        help="LBPH model, or face_recognition encodings stored in students.encoding")
+    parser.add_argument("--tolerance", type=float, default=embeddings.TOLERANCE,
+                        help="with --backend embedding, max face distance for a match")
+    parser.add_argument("--nprobe", type=int, default=ann_index.DEFAULT_NPROBE,
+                        help="IVF partitions searched per face if the LBPH model has an index (0 = exact scan)")
+    args = parser.parse_args(argv)
+
+    if args.backend == "embedding":
+        recognizer = embeddings.EmbeddingRecognizer.from_db(DB, args.tolerance)
+        if len(recognizer) == 0:
+            print("No face encodings in the database. Run train.py --backend embedding first.")
+            return 1
+        print(f"Loaded {len(recognizer)} encodings of {len(set(recognizer.labels.tolist()))} students.")
+    else:
+        # Prefers the memory-mapped trainer/trainer.lbph, falls back to trainer.yml
+        recognizer = model_store.load_recognizer()
+        if recognizer is None:
+            print("Model not found. Run train.py first.")
+            return 1
+        if getattr(recognizer, "index", None) is not None:
+            recognizer.nprobe = args.nprobe
+            print(f"Using the IVF index: {args.nprobe} of {recognizer.index.nlist} partitions per face.")
+
+    face_cascade = create_face_cascade()
+    id_name = load_id_name_map()
+    tracker = None
+    if args.track:
+        tracker = FaceTracker(detect_faces, face_cascade,
+                              detect_every=args.detect_every, vote_k=args.vote_k)
+    processor = FrameProcessor(recognizer, face_cascade, id_name, tracker)
+
+    if args.sources:
+        writer = None
+        if not args.dry_run:
+            writer = AttendanceWriter(DB, batch_size=args.batch_size, flush_interval=args.flush_interval).start()
+        try:
+            report = run_headless(args.sources, processor, writer, migrations.load_period_seconds(DB))
+        finally:
+            if writer is not None:
+                writer.close()
+        print_report(report)
+        if args.report_json:
+            with open(args.report_json, "w") as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    writer = AttendanceWriter(DB, batch_size=args.batch_size, flush_interval=args.flush_interval).start()
+    cam = cv2.VideoCapture(args.camera)
+    print("Running recognizer. Press 'q' to quit.")
+    try:
+        if args.pipeline:
+            run_pipeline(cam, processor, writer, queue_size=max(1, args.queue_size),
+                         stats_interval=args.stats_interval)
+        else:
+            run_serial(cam, processor, writer)
+    finally:
+        cam.release()
+        cv2.destroyAllWindows()
+        # Flushes attendance still buffered in the writer
+        writer.close()
+    return 0
 
-cam.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    exit(main())
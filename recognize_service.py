@@ -0,0 +1,274 @@
+"""Multi-stream recognition service: one worker process per camera.
+
+    python recognize_service.py --stream room101=0 --stream room102=rtsp://...
+    python recognize_service.py --config streams.json
+
+streams.json is a list of {"name": ..., "source": ...}; a source that is all
+digits is a camera index, anything else is passed to cv2.VideoCapture.
+
+The supervisor loads the id -> name map once and makes sure the binary model
+exists (converting trainer.yml once if needed). Every worker memory-maps the
+same trainer.lbph, so the histograms are held once in the page cache however
+many streams run. Workers send attendance events and stats back on one
+queue, and the supervisor writes all attendance through a single
+AttendanceWriter. Workers that crash are restarted with backoff.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import time
+
+import model_store
+import ann_index
+from attendance_writer import AttendanceWriter, PeriodCache
+import migrations
+from migrations import DEFAULT_PERIOD_SECONDS
+
+DB = migrations.DB
+MAX_BACKOFF = 30.0
+
+
+def parse_source(source):
+    source = str(source)
+    return int(source) if source.isdigit() else source
+
+
+def stream_worker(name, source, id_name, options, events, stop):
+    """Capture + recognize one stream; runs in its own process"""
+    import cv2
+    import recognize_cv
+    from tracking import FaceTracker
+    from pipeline import StageQueue
+
+    # The supervisor handles Ctrl+C and tells workers to stop through `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    recognizer = model_store.load_model(model_store.BINARY_MODEL_PATH)
+    recognizer.nprobe = options.get("nprobe", recognizer.nprobe)
+    face_cascade = recognize_cv.create_face_cascade()
+    tracker = None
+    if options.get("track"):
+        tracker = FaceTracker(recognize_cv.detect_faces, face_cascade,
+                              detect_every=options.get("detect_every", 10),
+                              vote_k=options.get("vote_k", 5))
+    processor = recognize_cv.FrameProcessor(recognizer, face_cascade, id_name, tracker)
+
+    cam = cv2.VideoCapture(parse_source(source))
+    if not cam.isOpened():
+        raise RuntimeError(f"could not open stream {name}: {source}")
+
+    # Capture runs on its own thread and keeps only the freshest frame, so
+    # lag stays bounded when recognition is slower than the camera
+    frames = StageQueue(1, drop_oldest=True)
+    ended = threading.Event()
+
+    def capture():
+        while not stop.is_set():
+            ret, frame = cam.read()
+            if not ret:
+                break
+            frames.put_item((time.time(), frame), stop)
+        ended.set()
+
+    threading.Thread(target=capture, name=f"capture-{name}", daemon=True).start()
+
+    # Saves sending events the supervisor's writer would skip anyway
+    periods = PeriodCache(options.get("period_seconds", DEFAULT_PERIOD_SECONDS))
+    processed = 0
+    lag = 0.0
+    last_report = time.time()
+    last_processed = 0
+    try:
+        while not stop.is_set():
+            try:
+                captured_at, frame = frames.get(timeout=0.2)
+            except queue.Empty:
+                if ended.is_set():
+                    break
+                continue
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            for box, sid, sname, label in processor.process(gray):
+                seen_at = time.time()
+                if sid is not None and periods.claim(sid, seen_at) is not None:
+                    events.put(("attendance", name, int(sid), sname, seen_at))
+            processed += 1
+            lag = time.time() - captured_at
+
+            now = time.time()
+            if now - last_report >= options.get("stats_interval", 5.0):
+                events.put(("stats", name, {
+                    "fps": round((processed - last_processed) / (now - last_report), 2),
+                    "lag": round(lag, 3),
+                    "frames": processed,
+                    "dropped": frames.dropped,
+                    "detect_seconds": round(processor.detect_seconds, 3),
+                    "predict_seconds": round(processor.predict_seconds, 3),
+                }))
+                last_report, last_processed = now, processed
+    finally:
+        cam.release()
+
+
+class StreamSupervisor:
+    def __init__(self, streams, options, db_path=DB, status_file=None):
+        self.streams = streams
+        self.options = options
+        self.db_path = db_path
+        self.status_file = status_file
+        self.ctx = mp.get_context("spawn")
+        self.events = self.ctx.Queue()
+        self.stop = self.ctx.Event()
+        self.workers = {}
+        self.id_name = None
+        self.stats = {s["name"]: {"source": str(s["source"]), "restarts": 0, "state": "starting"}
+                      for s in streams}
+
+    def prepare_model(self):
+        """Make sure the shared, memory-mappable model exists"""
+        if not os.path.exists(model_store.BINARY_MODEL_PATH):
+            if not os.path.exists(model_store.YAML_MODEL_PATH):
+                raise SystemExit("Model not found. Run train.py first.")
+            print("Converting trainer.yml to the binary model once for all workers...")
+            model_store.save_model(model_store.load_yaml(model_store.YAML_MODEL_PATH),
+                                   model_store.BINARY_MODEL_PATH)
+
+    def start_worker(self, stream):
+        proc = self.ctx.Process(
+            target=stream_worker, name=f"stream-{stream['name']}",
+            args=(stream["name"], stream["source"], self.id_name, self.options, self.events, self.stop),
+            daemon=True)
+        proc.start()
+        self.workers[stream["name"]] = {"proc": proc, "stream": stream, "restart_at": None,
+                                        "backoff": self.workers.get(stream["name"], {}).get("backoff", 1.0)}
+        self.stats[stream["name"]]["state"] = "running"
+
+    def drain_events(self, writer):
+        while True:
+            try:
+                event = self.events.get(timeout=0.5)
+            except queue.Empty:
+                return
+            if event[0] == "attendance":
+                _, stream, sid, name, seen_at = event
+                timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(seen_at))
+                if writer.mark(sid, name, timestamp) is not None:
+                    print(f"[{stream}] Marked {name} at {timestamp}")
+            elif event[0] == "stats":
+                _, stream, values = event
+                self.stats[stream].update(values)
+                # A worker that reports is healthy again
+                self.workers[stream]["backoff"] = 1.0
+
+    def check_workers(self):
+        now = time.time()
+        for name, worker in self.workers.items():
+            proc = worker["proc"]
+            if proc.is_alive():
+                continue
+            if worker["restart_at"] is None:
+                if proc.exitcode == 0:
+                    if self.stats[name]["state"] != "finished":
+                        print(f"[{name}] stream ended")
+                    self.stats[name]["state"] = "finished"
+                    continue
+                worker["restart_at"] = now + worker["backoff"]
+                self.stats[name]["state"] = "crashed"
+                print(f"[{name}] worker exited with code {proc.exitcode}; restarting in {worker['backoff']:.0f}s")
+            elif now >= worker["restart_at"]:
+                backoff = min(worker["backoff"] * 2, MAX_BACKOFF)
+                self.stats[name]["restarts"] += 1
+                self.start_worker(worker["stream"])
+                self.workers[name]["backoff"] = backoff
+
+    def report(self):
+        for name, values in self.stats.items():
+            print(f"[{name}] {values['state']} fps={values.get('fps', 0)} lag={values.get('lag', 0)}s "
+                  f"frames={values.get('frames', 0)} dropped={values.get('dropped', 0)} restarts={values['restarts']}")
+        if self.status_file:
+            tmp_path = self.status_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"updated_at": time.time(), "streams": self.stats}, f, indent=2)
+            os.replace(tmp_path, self.status_file)
+
+    def run(self):
+        from recognize_cv import load_id_name_map
+
+        self.prepare_model()
+        self.id_name = load_id_name_map(self.db_path)
+        writer = AttendanceWriter(self.db_path).start()
+        # Workers pre-filter events with the same period window the writer read from the DB
+        self.options["period_seconds"] = writer.periods.period_seconds
+        for stream in self.streams:
+            self.start_worker(stream)
+
+        last_report = time.time()
+        try:
+            while not self.stop.is_set():
+                self.drain_events(writer)
+                self.check_workers()
+                if all(s["state"] == "finished" for s in self.stats.values()):
+                    break
+                if time.time() - last_report >= self.options.get("stats_interval", 5.0):
+                    self.report()
+                    last_report = time.time()
+        finally:
+            self.stop.set()
+            for worker in self.workers.values():
+                worker["proc"].join(timeout=5)
+                if worker["proc"].is_alive():
+                    worker["proc"].terminate()
+            # Events sent while shutting down still get written
+            self.drain_events(writer)
+            writer.close()
+            self.report()
+
+
+def load_streams(args):
+    streams = []
+    if args.config:
+        with open(args.config) as f:
+            streams.extend(json.load(f))
+    for spec in args.stream or []:
+        name, _, source = spec.partition("=")
+        if not source:
+            name, source = f"stream{len(streams) + 1}", name
+        streams.append({"name": name, "source": source})
+    return streams
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run recognition on several camera streams")
+    parser.add_argument("--config", help="JSON file with a list of {name, source}")
+    parser.add_argument("--stream", action="append", help="name=source (repeatable)")
+    parser.add_argument("--track", action="store_true", help="use face tracking in every worker")
+    parser.add_argument("--detect-every", type=int, default=10)
+    parser.add_argument("--vote-k", type=int, default=5)
+    parser.add_argument("--stats-interval", type=float, default=5.0,
+                        help="seconds between per-stream fps/lag reports")
+    parser.add_argument("--status-file", help="also write per-stream stats to this JSON file")
+    parser.add_argument("--nprobe", type=int, default=ann_index.DEFAULT_NPROBE,
+                        help="IVF partitions searched per face if the model has an index (0 = exact scan)")
+    args = parser.parse_args(argv)
+
+    streams = load_streams(args)
+    if not streams:
+        parser.error("no streams given; use --stream or --config")
+
+    options = {"track": args.track, "detect_every": args.detect_every,
+               "vote_k": args.vote_k, "stats_interval": args.stats_interval,
+               "nprobe": args.nprobe}
+    supervisor = StreamSupervisor(streams, options, status_file=args.status_file)
+    signal.signal(signal.SIGTERM, lambda *a: supervisor.stop.set())
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,11 +1,13 @@
 import cv2
 import os
+import dataset_manifest
 if not os.path.exists("dataset"):
     os.makedirs("dataset")
 
 def register(student_id, student_name, samples=20):
     cam = cv2.VideoCapture(0)
     face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    conn = dataset_manifest.connect()
     count = 0
     print("Press SPACE to capture images. Close window or press ESC to stop early.")
     while True:
@@ -29,15 +31,20 @@ def register(student_id, student_name, samples=20):
             (x,y,w,h) = faces[0]
             face_img = gray[y:y+h, x:x+w]
             count += 1
-            filename = f"dataset/{student_name}.{student_id}.{count}.jpg"
-            cv2.imwrite(filename, face_img)
-            print(f"Saved {filename} ({count}/{samples})")
+            # Continue after the student's existing samples instead of overwriting them
+            index = dataset_manifest.next_free_index(conn, student_id, student_name)
+            filename = f"{student_name}.{student_id}.{index}.jpg"
+            cv2.imwrite(os.path.join("dataset", filename), face_img)
+            dataset_manifest.record_image(conn, filename)
+            conn.commit()
+            print(f"Saved dataset/{filename} ({count}/{samples})")
             if count >= samples:
                 print("Collected required samples.")
                 break
 
     cam.release()
     cv2.destroyAllWindows()
+    conn.close()
 
 if __name__ == "__main__":
     sid = input("Enter numeric student ID (e.g., 1): ").strip()
@@ -45,4 +52,5 @@ if __name__ == "__main__":
     if not sid.isdigit() or name == "":
         print("Invalid input. ID must be a number and name non-empty.")
     else:
-        register(int(sid), name, samples=20)
\ No newline at end of file
+        register(int(sid), name, samples=20)
+        print("Run `python train.py --incremental` to add the new samples to the model.")
\ No newline at end of file
@@ -0,0 +1,193 @@
+"""Packed, memory-mappable store of face samples.
+
+dataset/ holds one small JPEG per sample, so training pays an open and a
+JPEG decode per sample and the directory grows by thousands of files per
+class. The sample store keeps the training-ready grayscale face crops back
+to back in a few large shard files, plus one index array with each sample's
+(student_id, shard, offset, h, w):
+
+    samples/index.npy        structured array, loaded with mmap_mode='r'
+    samples/shard-0000.bin   raw uint8 pixels, row-major, memory-mapped
+    samples/meta.json        id -> name map and format version
+
+Reading a sample is a slice of a memory map: no per-file syscalls and no
+decoding. The store is rebuilt from the dataset layout (using train.py's
+detection and its face cache), and can be written back out as
+name.id.n.jpg files:
+
+    python sample_store.py import [--workers N]
+    python sample_store.py export DIR
+    python sample_store.py info
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+STORE_DIR = "samples"
+SHARD_BYTES = 256 * 1024 * 1024
+FORMAT_VERSION = 1
+
+INDEX_DTYPE = np.dtype([("student_id", "<i4"), ("shard", "<i4"), ("offset", "<i8"),
+                        ("h", "<i4"), ("w", "<i4")])
+
+
+def shard_path(store_dir, shard):
+    return os.path.join(store_dir, f"shard-{shard:04d}.bin")
+
+
+def write_store(crops, ids, names, store_dir=STORE_DIR, shard_bytes=SHARD_BYTES):
+    """Pack crops (2-D uint8 arrays) with their ids into a new store.
+
+    Written next to store_dir and swapped in at the end, so readers never
+    see a half-written store.
+    """
+    tmp_dir = store_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    index = np.zeros(len(crops), dtype=INDEX_DTYPE)
+    shard, offset = 0, 0
+    out = open(shard_path(tmp_dir, shard), "wb")
+    try:
+        for i, (crop, sid) in enumerate(zip(crops, ids)):
+            data = np.ascontiguousarray(crop, dtype=np.uint8)
+            if offset and offset + data.nbytes > shard_bytes:
+                out.close()
+                shard, offset = shard + 1, 0
+                out = open(shard_path(tmp_dir, shard), "wb")
+            out.write(data.tobytes())
+            index[i] = (int(sid), shard, offset, data.shape[0], data.shape[1])
+            offset += data.nbytes
+    finally:
+        out.close()
+    np.save(os.path.join(tmp_dir, "index.npy"), index)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({"version": FORMAT_VERSION, "shards": shard + 1,
+                   "names": {str(k): v for k, v in names.items()}}, f)
+
+    old_dir = store_dir.rstrip("/\\") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(store_dir):
+        os.replace(store_dir, old_dir)
+    os.replace(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(index)
+
+
+class SampleStore:
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported sample store version {meta.get('version')}")
+        self.names = {int(k): v for k, v in meta["names"].items()}
+        self.index = np.load(os.path.join(store_dir, "index.npy"), mmap_mode="r")
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def labels(self):
+        return np.asarray(self.index["student_id"], dtype=np.int32)
+
+    def _shard(self, shard):
+        data = self._shards.get(shard)
+        if data is None:
+            path = shard_path(self.store_dir, shard)
+            # np.memmap refuses empty files (a store with no samples)
+            data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+            self._shards[shard] = data
+        return data
+
+    def sample(self, i):
+        """Sample i as an (h, w) view into the memory-mapped shard"""
+        entry = self.index[i]
+        start = int(entry["offset"])
+        h, w = int(entry["h"]), int(entry["w"])
+        return np.asarray(self._shard(int(entry["shard"]))[start:start + h * w]).reshape(h, w)
+
+    def __iter__(self):
+        for i in range(len(self.index)):
+            yield int(self.index[i]["student_id"]), self.sample(i)
+
+    def crops(self):
+        return [self.sample(i) for i in range(len(self.index))]
+
+
+def exists(store_dir=STORE_DIR):
+    return os.path.exists(os.path.join(store_dir, "index.npy"))
+
+
+def import_dataset(store_dir=STORE_DIR, workers=1, chunksize=16, use_cache=True):
+    """Detect/crop every image in the dataset manifest and pack the results"""
+    import dataset_manifest
+    import train
+    from face_cache import FaceCache
+
+    conn = dataset_manifest.connect()
+    dataset_manifest.rescan(conn)
+    images = dataset_manifest.images(conn)
+    names = dataset_manifest.id_name_map(conn)
+    conn.close()
+    cache = FaceCache() if use_cache else None
+    try:
+        crops, ids = train.load_samples(list(images), workers=workers, chunksize=chunksize,
+                                        cache=cache, stamps=images)
+    finally:
+        if cache is not None:
+            cache.close()
+    return write_store(crops, ids, names, store_dir)
+
+
+def export_dataset(out_dir, store_dir=STORE_DIR):
+    """Write every sample as name.id.n.jpg, numbering after files already in out_dir"""
+    import cv2
+    import dataset_manifest
+
+    store = SampleStore(store_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    next_index = {}
+    for f in os.listdir(out_dir):
+        parsed = dataset_manifest.parse_filename(f)
+        if parsed and parsed[2] is not None:
+            next_index[parsed[1]] = max(next_index.get(parsed[1], 1), parsed[2] + 1)
+    written = 0
+    for sid, crop in store:
+        index = next_index.get(sid, 1)
+        next_index[sid] = index + 1
+        name = store.names.get(sid, f"student{sid}")
+        cv2.imwrite(os.path.join(out_dir, f"{name}.{sid}.{index}.jpg"), crop)
+        written += 1
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build, export or inspect the packed sample store")
+    parser.add_argument("--store", default=STORE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="pack the faces of every dataset/ image")
+    p_import.add_argument("--workers", type=int, default=1, help="processes for load+detect (0 = one per CPU core)")
+    p_import.add_argument("--chunksize", type=int, default=16)
+    p_import.add_argument("--no-cache", action="store_true", help="ignore trainer/face_cache.db")
+    p_export = sub.add_parser("export", help="write samples back out as name.id.n.jpg files")
+    p_export.add_argument("out_dir")
+    sub.add_parser("info", help="print sample and shard counts")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+        count = import_dataset(args.store, workers, max(1, args.chunksize), not args.no_cache)
+        print(f"Packed {count} face samples into {args.store}/")
+    elif args.command == "export":
+        count = export_dataset(args.out_dir, args.store)
+        print(f"Exported {count} samples to {args.out_dir}/")
+        print("If that is the dataset folder, run `python dataset_manifest.py` to index the new files.")
+    else:
+        store = SampleStore(args.store)
+        shards = len({int(s) for s in store.index["shard"]}) if len(store) else 0
+        print(f"{len(store)} samples of {len(set(store.labels.tolist()))} students in {shards} shard(s).")
@@ -0,0 +1,61 @@
+"""Full-text search over students and attendance names.
+
+Migration 3 builds FTS5 indexes (students_fts, attendance_fts) that triggers
+keep in sync with the base tables. Every word typed becomes a prefix term,
+so "ra ku" finds "Rahul Kumar", and results come back ranked by bm25 and
+capped at `limit`, without touching the base tables beyond the hits. On a
+SQLite built without FTS5 the same functions fall back to LIKE scans.
+"""
+import re
+
+# bm25 column weights: a name hit outranks an email or phone hit
+STUDENT_WEIGHTS = (10.0, 2.0, 2.0)
+
+_available = {}
+
+
+def fts_available(conn):
+    """Whether migration 3 created the FTS5 tables in this database"""
+    key = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not _available.get(key):
+        _available[key] = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name='students_fts'").fetchone() is not None
+    return _available[key]
+
+
+def fts_query(text):
+    """User input -> FTS5 query: every word must match as a prefix"""
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{w}"*' for w in words) or None
+
+
+def search_students(conn, text, limit):
+    query = fts_query(text)
+    if query and fts_available(conn):
+        return conn.execute(f'''
+            SELECT s.id, s.name, s.email, s.phone
+            FROM students_fts f JOIN students s ON s.id = f.rowid
+            WHERE students_fts MATCH ?
+            ORDER BY bm25(students_fts, {", ".join(map(str, STUDENT_WEIGHTS))}), s.id
+            LIMIT ?''', (query, limit)).fetchall()
+    pattern = f"%{text.lower()}%"
+    return conn.execute(
+        "SELECT id, name, email, phone FROM students "
+        "WHERE LOWER(name) LIKE ? OR LOWER(email) LIKE ? OR phone LIKE ? ORDER BY id LIMIT ?",
+        (pattern, pattern, pattern, limit)).fetchall()
+
+
+def search_attendance(conn, text, limit):
+    """Matching records, best match first and newest first among equals"""
+    query = fts_query(text)
+    if query and fts_available(conn):
+        return conn.execute('''
+            SELECT a.id, a.student_id, a.name, a.timestamp, a.ts
+            FROM attendance_fts f JOIN attendance a ON a.id = f.rowid
+            WHERE attendance_fts MATCH ?
+            ORDER BY f.rank, a.ts DESC, a.id DESC
+            LIMIT ?''', (query, limit)).fetchall()
+    return conn.execute(
+        "SELECT id, student_id, name, timestamp, ts FROM attendance "
+        "WHERE LOWER(name) LIKE ? OR CAST(student_id AS TEXT) LIKE ? ORDER BY ts DESC, id DESC LIMIT ?",
+        (f"%{text.lower()}%", f"%{text}%", limit)).fetchall()
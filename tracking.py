@@ -0,0 +1,128 @@
+"""Follow faces between frames so detection and LBPH predict don't run per frame.
+
+The full Haar cascade runs over the whole frame only every `detect_every`
+frames, or as soon as a track is lost. In between, each track is followed
+by running the cascade on a small window around its previous box, limited
+to face sizes close to the previous one, which is far cheaper than a full
+scan. Identity comes from a vote over the track's last `vote_k`
+predictions; once the vote is full a track only re-predicts every
+`refresh_every` frames, so a class sitting still costs almost nothing.
+"""
+from collections import Counter, deque
+import itertools
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+class Track:
+    _ids = itertools.count(1)
+
+    def __init__(self, box, vote_k):
+        self.id = next(Track._ids)
+        self.box = tuple(int(v) for v in box)
+        self.votes = deque(maxlen=vote_k)
+        self.misses = 0
+        self.last_predict = None
+
+    def identity(self):
+        """Majority student id over recent votes, or None while unsure/unknown"""
+        if not self.votes:
+            return None
+        sid, count = Counter(self.votes).most_common(1)[0]
+        if count * 2 <= self.votes.maxlen:
+            return None
+        return sid
+
+
+class FaceTracker:
+    def __init__(self, detect_fn, face_cascade, detect_every=10, vote_k=5,
+                 predict_every=2, refresh_every=30, search_margin=0.5, max_misses=2):
+        self.detect_fn = detect_fn
+        self.face_cascade = face_cascade
+        self.detect_every = max(1, detect_every)
+        self.vote_k = max(1, vote_k)
+        self.predict_every = max(1, predict_every)
+        self.refresh_every = max(1, refresh_every)
+        self.search_margin = search_margin
+        self.max_misses = max_misses
+        self.tracks = []
+        self.frame_no = 0
+        self.need_detect = True
+        self.detections = 0
+        self.searches = 0
+        self.predictions = 0
+
+    def update(self, gray, predict_fn):
+        """Advance one frame. predict_fn(roi) -> student id or None"""
+        if self.need_detect or self.frame_no % self.detect_every == 0 or not self.tracks:
+            self._detect(gray)
+        else:
+            self._follow(gray)
+        self._vote(gray, predict_fn)
+        self.frame_no += 1
+        return [t for t in self.tracks if t.misses == 0]
+
+    def _detect(self, gray):
+        self.detections += 1
+        self.need_detect = False
+        boxes = [tuple(int(v) for v in b) for b in self.detect_fn(self.face_cascade, gray)]
+        # Greedy IoU matching keeps identities (and their votes) across detections
+        pairs = sorted(((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks)
+                        for bi, b in enumerate(boxes)), reverse=True)
+        used_tracks, used_boxes = set(), set()
+        for score, ti, bi in pairs:
+            if score < 0.3 or ti in used_tracks or bi in used_boxes:
+                continue
+            self.tracks[ti].box = boxes[bi]
+            self.tracks[ti].misses = 0
+            used_tracks.add(ti)
+            used_boxes.add(bi)
+        kept = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.misses += 1
+            if track.misses <= self.max_misses:
+                kept.append(track)
+        for bi, box in enumerate(boxes):
+            if bi not in used_boxes:
+                kept.append(Track(box, self.vote_k))
+        self.tracks = kept
+
+    def _follow(self, gray):
+        rows, cols = gray.shape[:2]
+        for track in self.tracks:
+            x, y, w, h = track.box
+            mx, my = int(w * self.search_margin), int(h * self.search_margin)
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            x1, y1 = min(cols, x + w + mx), min(rows, y + h + my)
+            self.searches += 1
+            found = self.face_cascade.detectMultiScale(
+                gray[y0:y1, x0:x1], scaleFactor=1.1, minNeighbors=4,
+                minSize=(int(w * 0.7), int(h * 0.7)), maxSize=(int(w * 1.4) + 1, int(h * 1.4) + 1))
+            if len(found) == 0:
+                track.misses += 1
+                self.need_detect = True
+                continue
+            candidates = [(int(fx) + x0, int(fy) + y0, int(fw), int(fh)) for (fx, fy, fw, fh) in found]
+            track.box = max(candidates, key=lambda b: iou(b, track.box))
+            track.misses = 0
+
+    def _vote(self, gray, predict_fn):
+        for track in self.tracks:
+            if track.misses:
+                continue
+            interval = self.predict_every if len(track.votes) < self.vote_k else self.refresh_every
+            if track.last_predict is not None and self.frame_no - track.last_predict < interval:
+                continue
+            x, y, w, h = track.box
+            track.votes.append(predict_fn(gray[y:y+h, x:x+w]))
+            track.last_predict = self.frame_no
+            self.predictions += 1
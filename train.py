@@ -1,46 +1,383 @@
 import cv2
 import numpy as np
-from os import listdir
-from os.path import isfile, join
+from os.path import join
 import os
+import argparse
+import json
+import time
+from multiprocessing import Pool
+import model_store
+import ann_index
+import dataset_manifest
+from face_cache import FaceCache, MISS
+import sample_store
+import embeddings
 
 dataset_path = "dataset"
-if not os.path.exists(dataset_path):
-    print("dataset/ not found. Run register_cv.py to collect images first.")
-    exit()
+model_path = model_store.BINARY_MODEL_PATH
+yaml_path = model_store.YAML_MODEL_PATH
+# Which dataset files (and their size/mtime) are already in the model
+trained_files_path = "trainer/trained_files.json"
 
-images = [f for f in listdir(dataset_path) if isfile(join(dataset_path, f))]
+face_detector = None
 
-face_samples = []
-ids = []
+def init_worker():
+    """Load the Haar cascade once per process"""
+    global face_detector
+    face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
 
-face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-
-for imagePath in images:
+def extract_faces(imagePath):
+    """Load one dataset image and return (student_id, [face crops])"""
     try:
-        img = cv2.imread(join(dataset_path, imagePath), cv2.IMREAD_GRAYSCALE)
-        if img is None:
-            continue
         parts = imagePath.split(".")
         if len(parts) < 3:
-            continue
+            return None
         student_id = int(parts[1])
+        img = cv2.imread(join(dataset_path, imagePath), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            return None
         faces = face_detector.detectMultiScale(img)
-        for (x, y, w, h) in faces:
-            face_samples.append(img[y:y+h, x:x+w])
-            ids.append(student_id)
+        return student_id, [img[y:y+h, x:x+w] for (x, y, w, h) in faces]
     except Exception as e:
         print("Skipped", imagePath, "error:", e)
+        return None
+
+def load_samples(images, workers=1, chunksize=16, progress=None, cache=None, stamps=None):
+    """Run load+detect+crop over images, serially or in a process pool.
+
+    Results are collected in input order, so the face_samples/ids arrays are
+    identical whichever mode is used. progress(done, total) is called once
+    per chunk of images. With a FaceCache (and the manifest's size/mtime
+    stamps), only images missing from the cache are decoded and detected.
+    """
+    face_samples = []
+    ids = []
+    results = [None] * len(images)
+    todo = []
+    for index, imagePath in enumerate(images):
+        cached = cache.get(imagePath, stamps[imagePath]) if cache is not None else MISS
+        if cached is MISS:
+            todo.append(index)
+        else:
+            results[index] = cached
+    done = len(images) - len(todo)
+    if progress and done:
+        progress(done, len(images))
+
+    def collect(iterator):
+        nonlocal done
+        for index, result in zip(todo, iterator):
+            results[index] = result
+            if cache is not None:
+                cache.put(images[index], stamps[images[index]], result)
+            done += 1
+            if progress and (done % chunksize == 0 or done == len(images)):
+                progress(done, len(images))
+
+    pending = [images[index] for index in todo]
+    if workers > 1 and len(pending) > 1:
+        with Pool(workers, initializer=init_worker) as pool:
+            collect(pool.imap(extract_faces, pending, chunksize=chunksize))
+    elif pending:
+        init_worker()
+        collect(extract_faces(imagePath) for imagePath in pending)
+    if cache is not None:
+        cache.commit()
+
+    for result in results:
+        if result is None:
+            continue
+        student_id, faces = result
+        for face in faces:
+            face_samples.append(face)
+            ids.append(student_id)
+    return face_samples, ids
+
+def load_trained_files():
+    if not os.path.exists(trained_files_path) or not model_store.model_exists(model_path, yaml_path):
+        return None
+    try:
+        with open(trained_files_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_trained_files(record):
+    tmp_path = trained_files_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, trained_files_path)
+
+def file_student_id(filename):
+    parsed = dataset_manifest.parse_filename(filename)
+    return parsed[1] if parsed else None
+
+def plan_incremental(images, record):
+    """Return (images to add, student ids to drop), or None if a full rebuild is needed.
+
+    images maps file name -> [size, mtime_ns] as recorded in the manifest.
+    Students whose images are all gone (deleted students) are dropped from
+    the model by label; removing only some of a student's images needs a
+    rebuild, since samples are not tied to files in the model.
+    """
+    if record is None:
+        print("No record of a previous build; doing a full retrain.")
+        return None
+    current = set(images)
+    removed = [f for f in record if f not in current]
+    removed_ids = {file_student_id(f) for f in removed}
+    remaining_ids = {file_student_id(f) for f in images}
+    if removed_ids & remaining_ids:
+        print(f"{len(removed)} trained images were removed from dataset/; doing a full retrain.")
+        return None
+    changed = [f for f in images if f in record and record[f] != images[f]]
+    if changed:
+        print(f"{len(changed)} trained images changed on disk; doing a full retrain.")
+        return None
+    return [f for f in images if f not in record], sorted(removed_ids - {None})
+
+def print_progress(done, total):
+    # Parsed by training_jobs.py when run with --progress
+    print(f"PROGRESS {done} {total}", flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the face model from dataset/")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes for load+detect (0 = one per CPU core)")
+    parser.add_argument("--chunksize", type=int, default=16,
+                        help="images handed to a worker at a time")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only add images that are new since the last build")
+    parser.add_argument("--yaml", action="store_true",
+                        help=f"also export the model as {yaml_path} (always done when it already exists)")
+    parser.add_argument("--progress", action="store_true",
+                        help="print machine-readable PROGRESS/RESULT lines")
+    parser.add_argument("--verify", action="store_true",
+                        help="re-hash every dataset image when reconciling the manifest, not only changed ones")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="detect faces in every image instead of reusing trainer/face_cache.db")
+    parser.add_argument("--from-store", action="store_true",
+                        help="train from the packed sample store (sample_store.py) instead of dataset/")
+    parser.add_argument("--backend", choices=["lbph", "embedding"], default="lbph",
+                        help="build the LBPH model, or store face_recognition encodings in students.encoding")
+    parser.add_argument("--index", choices=["auto", "on", "off"], default="auto",
+                        help=f"IVF index beside the LBPH model (auto: from {ann_index.MIN_INDEXED_SAMPLES} samples)")
+    args = parser.parse_args(argv)
+
+    progress = print_progress if args.progress else None
+    # An existing trainer.yml is a fallback other tools still read: keep it current
+    args.yaml = args.yaml or os.path.exists(yaml_path)
+    if args.from_store:
+        status, stats = train_from_store(args.yaml, progress, args.backend, args.index)
+        if args.progress:
+            print("RESULT " + json.dumps(stats), flush=True)
+        return status
+
+    if not os.path.exists(dataset_path):
+        print("dataset/ not found. Run register_cv.py to collect images first.")
+        return 1
+
+    # The file list and size/mtime stamps come from the manifest. Reconciling
+    # it first only stats the files (hashing new or changed ones), which is
+    # cheap next to face detection, and picks up images copied in by hand
+    conn = dataset_manifest.connect()
+    stats = dataset_manifest.rescan(conn, dataset_path, verify=args.verify)
+    if stats["added"] or stats["updated"] or stats["removed"] or stats["repaired"]:
+        print(f"Dataset manifest: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['removed']} removed, {stats['repaired']} repaired.")
+    images = dataset_manifest.images(conn)
+    conn.close()
+    workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+    chunksize = max(1, args.chunksize)
+
+    status = 0
+    cache = None if args.no_cache else FaceCache()
+    try:
+        if args.backend == "embedding":
+            if args.incremental:
+                print("--incremental only applies to the LBPH model; recomputing every encoding.")
+            status, stats = full_train(images, workers, chunksize, args.yaml, progress, cache, args.backend)
+        elif args.incremental:
+            record = load_trained_files()
+            plan = plan_incremental(images, record)
+            if plan is not None:
+                new_images, removed_ids = plan
+                stats = update_model(record, {f: images[f] for f in new_images}, workers, chunksize,
+                                     args.yaml, progress, cache, removed_ids, args.index)
+            else:
+                status, stats = full_train(images, workers, chunksize, args.yaml, progress, cache,
+                                           index_mode=args.index)
+        else:
+            status, stats = full_train(images, workers, chunksize, args.yaml, progress, cache,
+                                       index_mode=args.index)
+    finally:
+        if cache is not None:
+            cache.close()
+    if cache is not None:
+        stats["cache_hits"], stats["cache_misses"] = cache.hits, cache.misses
+
+    if args.progress:
+        print("RESULT " + json.dumps(stats), flush=True)
+    return status
+
+def full_train(images, workers, chunksize, write_yaml=False, progress=None, cache=None, backend="lbph",
+               index_mode="auto"):
+    stats = {"mode": "full", "backend": backend, "images": len(images), "samples": 0, "unique_ids": 0}
+
+    started = time.time()
+    face_samples, ids = load_samples(list(images), workers=workers, chunksize=chunksize, progress=progress,
+                                     cache=cache, stamps=images)
+    if cache is not None:
+        cache.prune(images)
+    stats["load_seconds"] = round(time.time() - started, 3)
+
+    if len(ids) == 0:
+        print("No training data found in dataset/ — run register_cv.py first.")
+        return 1, stats
+
+    if backend == "embedding":
+        save_embeddings(face_samples, ids, stats)
+        return 0, stats
+
+    train_and_save(face_samples, ids, write_yaml, stats, index_mode)
+    save_trained_files(dict(images))
+    print(f"Training completed. {stats['unique_ids']} unique IDs. Model saved to {model_path}")
+    return 0, stats
+
+def want_index(model, index_mode):
+    if index_mode == "off" or len(model) == 0:
+        return False
+    return index_mode == "on" or len(model) >= ann_index.MIN_INDEXED_SAMPLES
+
+def index_model(model, index_mode, stats):
+    """Build, keep or drop the model's IVF index according to --index"""
+    if not want_index(model, index_mode):
+        model.index = None
+    elif model.index is None or len(model) > 2 * model.index.built_count:
+        # New, or grown to twice the size it was clustered at: re-cluster
+        # so the partitions stay balanced
+        started = time.time()
+        model.build_index()
+        stats["index_seconds"] = round(time.time() - started, 3)
+    stats["index_lists"] = model.index.nlist if model.index is not None else 0
+
+def train_and_save(face_samples, ids, write_yaml, stats, index_mode="auto"):
+    started = time.time()
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train(face_samples, np.array(ids))
+    stats["train_seconds"] = round(time.time() - started, 3)
+
+    model = model_store.from_recognizer(recognizer)
+    index_model(model, index_mode, stats)
+
+    started = time.time()
+    if not os.path.exists('trainer'):
+        os.makedirs('trainer')
+    model_store.save_model(model, model_path)
+    if write_yaml:
+        recognizer.write(yaml_path)
+    stats["save_seconds"] = round(time.time() - started, 3)
+
+    stats["samples"] = len(ids)
+    stats["unique_ids"] = len(np.unique(ids))
+
+def save_embeddings(face_samples, ids, stats, names=None):
+    """Encode every face sample and store each student's encodings in the DB"""
+    started = time.time()
+    encodings = embeddings.compute_student_encodings(face_samples, ids)
+    stats["train_seconds"] = round(time.time() - started, 3)
+
+    started = time.time()
+    conn = dataset_manifest.connect()
+    try:
+        all_names = dataset_manifest.id_name_map(conn)
+        all_names.update(names or {})
+        embeddings.save_encodings(conn, encodings, all_names)
+    finally:
+        conn.close()
+    stats["save_seconds"] = round(time.time() - started, 3)
+
+    stats["samples"] = len(ids)
+    stats["unique_ids"] = len(encodings)
+    print(f"Encoding completed. {stats['unique_ids']} unique IDs. Encodings saved to students.encoding")
+
+def train_from_store(write_yaml=False, progress=None, backend="lbph", index_mode="auto"):
+    """Full train from the packed samples: no per-file opens, decoding or detection"""
+    stats = {"mode": "store", "backend": backend, "images": 0, "samples": 0, "unique_ids": 0}
+    if not sample_store.exists():
+        print("Sample store not found. Run `python sample_store.py import` first.")
+        return 1, stats
+
+    started = time.time()
+    store = sample_store.SampleStore()
+    face_samples, ids = store.crops(), store.labels
+    stats["load_seconds"] = round(time.time() - started, 3)
+    if progress:
+        progress(len(ids), len(ids))
+    if len(ids) == 0:
+        print("The sample store is empty.")
+        return 1, stats
+    if backend == "embedding":
+        save_embeddings(face_samples, ids, stats, store.names)
+        return 0, stats
+
+    train_and_save(face_samples, ids, write_yaml, stats, index_mode)
+    # The dataset/ record no longer describes the model; the next
+    # --incremental run rebuilds from dataset/
+    if os.path.exists(trained_files_path):
+        os.remove(trained_files_path)
+    print(f"Training completed from {store.store_dir}/. {stats['unique_ids']} unique IDs. "
+          f"Model saved to {model_path}")
+    return 0, stats
+
+def load_existing_model():
+    if os.path.exists(model_path):
+        return model_store.load_model(model_path)
+    return model_store.load_yaml(yaml_path)
+
+def update_model(record, new_images, workers, chunksize, write_yaml=False, progress=None, cache=None,
+                 removed_ids=(), index_mode="auto"):
+    """Apply only new images (and deleted students) to the existing model, as LBPH update() does"""
+    stats = {"mode": "incremental", "images": len(new_images), "samples": 0, "unique_ids": 0,
+             "removed_ids": len(removed_ids)}
+    if not new_images and not removed_ids:
+        print("Model is up to date. No new images in dataset/.")
+        return stats
+
+    started = time.time()
+    face_samples, ids = load_samples(list(new_images), workers=workers, chunksize=chunksize, progress=progress,
+                                     cache=cache, stamps=new_images)
+    stats["load_seconds"] = round(time.time() - started, 3)
 
-if len(ids) == 0:
-    print("No training data found in dataset/ — run register_cv.py first.")
-    exit()
+    started = time.time()
+    if len(ids) > 0 or removed_ids:
+        model = load_existing_model()
+        if removed_ids:
+            # A deleted student's samples are exactly the rows with their label
+            model = model.without(removed_ids)
+        if len(ids) > 0:
+            # Histograms for the new samples only, computed by OpenCV with the
+            # model's own parameters, then appended to the stored arrays
+            recognizer = cv2.face.LBPHFaceRecognizer_create(
+                model.radius, model.neighbors, model.grid_x, model.grid_y)
+            recognizer.update(face_samples, np.array(ids))
+            model = model.appended(model_store.from_recognizer(recognizer).histograms, np.array(ids))
+        index_model(model, index_mode, stats)
+        model_store.save_model(model, model_path)
+        if write_yaml:
+            model_store.export_yaml(model, yaml_path)
 
-recognizer = cv2.face.LBPHFaceRecognizer_create()
-recognizer.train(face_samples, np.array(ids))
+    for f in [f for f in record if file_student_id(f) in removed_ids]:
+        del record[f]
+    record.update(new_images)
+    save_trained_files(record)
+    stats["train_seconds"] = round(time.time() - started, 3)
 
-if not os.path.exists('trainer'):
-    os.makedirs('trainer')
-recognizer.write('trainer/trainer.yml')
+    stats["samples"] = len(ids)
+    stats["unique_ids"] = len(np.unique(ids))
+    print(f"Incremental update completed. {len(new_images)} new images, {len(ids)} face samples "
+          f"for {stats['unique_ids']} IDs, {len(removed_ids)} students removed. Model saved to {model_path}")
+    return stats
 
-print(f"Training completed. {len(np.unique(ids))} unique IDs. Model saved to trainer/trainer.yml")
+if __name__ == "__main__":
+    exit(main())
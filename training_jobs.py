@@ -0,0 +1,218 @@
+"""Background training jobs for the /train route.
+
+Training runs `train.py --incremental --progress` in a subprocess watched by a
+background thread, so the web request returns immediately. Jobs are
+single-flight: while one is queued or running, further requests coalesce into
+it instead of starting a competing retrain. The check happens inside a
+`BEGIN IMMEDIATE` transaction, so it also holds across several server
+processes sharing attendance.db.
+
+Every job is a row in `training_jobs` with its progress, timings, sample
+counts and captured output, for the status API and later inspection.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+TRAIN_TIMEOUT = 300
+# Minimum seconds between progress writes to the DB
+PROGRESS_INTERVAL = 0.5
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def create_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS training_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status TEXT NOT NULL,
+        requested_by INTEGER,
+        requests INTEGER NOT NULL DEFAULT 1,
+        pid INTEGER,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        progress_done INTEGER NOT NULL DEFAULT 0,
+        progress_total INTEGER NOT NULL DEFAULT 0,
+        returncode INTEGER,
+        samples INTEGER,
+        unique_ids INTEGER,
+        result TEXT,
+        output TEXT,
+        error TEXT
+    )
+    ''')
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def job_to_dict(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    if job["started_at"]:
+        job["duration"] = round((job["finished_at"] or time.time()) - job["started_at"], 3)
+    else:
+        job["duration"] = None
+    total = job["progress_total"]
+    job["percent"] = round(100.0 * job["progress_done"] / total, 1) if total else None
+    job["done"] = job["status"] not in ACTIVE_STATUSES
+    return job
+
+
+class TrainingJobRunner:
+    def __init__(self, db_path, workdir, command=None, timeout=TRAIN_TIMEOUT):
+        self.db_path = db_path
+        self.workdir = workdir
+        self.command = command or [sys.executable, "train.py", "--incremental", "--progress"]
+        self.timeout = timeout
+        # Job ids whose watcher thread is alive in this process
+        self._running = set()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def submit(self, requested_by=None):
+        """Start a training job, or join the one already queued/running.
+
+        Returns (job_id, started) where started is False when coalesced.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            active = conn.execute(
+                "SELECT id, pid FROM training_jobs WHERE status IN (?, ?) ORDER BY id DESC LIMIT 1",
+                ACTIVE_STATUSES
+            ).fetchone()
+            if active and _pid_alive(active["pid"]) and not self._orphaned(active):
+                conn.execute("UPDATE training_jobs SET requests = requests + 1 WHERE id=?", (active["id"],))
+                conn.execute("COMMIT")
+                return active["id"], False
+            if active:
+                # The server process that owned it is gone (restart/crash),
+                # or its watcher thread here died before recording the outcome
+                conn.execute(
+                    "UPDATE training_jobs SET status='failed', finished_at=?, error=? WHERE id=?",
+                    (time.time(), "Interrupted: server process exited", active["id"])
+                )
+            cur = conn.execute(
+                "INSERT INTO training_jobs (status, requested_by, pid, created_at) VALUES ('queued', ?, ?, ?)",
+                (requested_by, os.getpid(), time.time())
+            )
+            job_id = cur.lastrowid
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        self._running.add(job_id)
+        thread = threading.Thread(target=self._run, args=(job_id,), name=f"training-job-{job_id}", daemon=True)
+        thread.start()
+        return job_id, True
+
+    def _orphaned(self, job):
+        return job["pid"] == os.getpid() and job["id"] not in self._running
+
+    def get(self, job_id):
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM training_jobs WHERE id=?", (job_id,)).fetchone()
+        conn.close()
+        return job_to_dict(row)
+
+    def latest(self):
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM training_jobs ORDER BY id DESC LIMIT 1").fetchone()
+        conn.close()
+        return job_to_dict(row)
+
+    def _run(self, job_id):
+        started = time.time()
+        output = []
+        result = None
+        error = None
+        returncode = None
+        last_write = 0.0
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute("UPDATE training_jobs SET status='running', started_at=? WHERE id=?", (started, job_id))
+            # train.py must use the server's database, not whatever attendance.db is in workdir
+            proc = subprocess.Popen(
+                self.command, cwd=self.workdir, stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT, text=True, bufsize=1,
+                env=dict(os.environ, ATTENDANCE_DB=os.path.abspath(self.db_path))
+            )
+            timer = threading.Timer(self.timeout, proc.kill)
+            timer.start()
+            try:
+                for line in proc.stdout:
+                    if line.startswith("PROGRESS "):
+                        done, total = (int(v) for v in line.split()[1:3])
+                        now = time.time()
+                        if now - last_write >= PROGRESS_INTERVAL or done == total:
+                            conn.execute(
+                                "UPDATE training_jobs SET progress_done=?, progress_total=? WHERE id=?",
+                                (done, total, job_id)
+                            )
+                            last_write = now
+                    elif line.startswith("RESULT "):
+                        result = json.loads(line[len("RESULT "):])
+                    else:
+                        output.append(line)
+                returncode = proc.wait()
+            finally:
+                timer.cancel()
+            if returncode != 0:
+                error = f"train.py exited with code {returncode}"
+                if time.time() - started >= self.timeout:
+                    error = f"Training timed out after {self.timeout} seconds"
+        except Exception as e:
+            error = str(e)
+        finally:
+            self._finish(conn, job_id, returncode, result, output, error)
+            self._running.discard(job_id)
+
+    def _finish(self, conn, job_id, returncode, result, output, error):
+        """Record the outcome; a job must never be left queued/running,
+        or every later /train would join it until the server restarts"""
+        values = ("failed" if error else "succeeded", time.time(), returncode,
+                  result.get("samples") if result else None,
+                  result.get("unique_ids") if result else None,
+                  json.dumps(result) if result else None,
+                  "".join(output), error, job_id)
+        for attempt in range(3):
+            try:
+                if conn is None:
+                    conn = self._connect()
+                conn.execute(
+                    "UPDATE training_jobs SET status=?, finished_at=?, returncode=?, samples=?, unique_ids=?, "
+                    "result=?, output=?, error=? WHERE id=?", values
+                )
+                break
+            except sqlite3.Error as e:
+                print(f"Could not record training job {job_id} (attempt {attempt + 1}): {e}")
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                time.sleep(1)
+        if conn is not None:
+            conn.close()